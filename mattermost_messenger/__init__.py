@@ -5,23 +5,38 @@ Mattermost Messenger package
 """
 
 
-from .sender import MattermostSender, MattermostError
+from .sender import MattermostSender, MattermostError, CircuitOpenError
 from .threaded import MattermostSenderThreaded
+from .retry import RetryPolicy
+from .breaker import CircuitBreaker
 from .handler import MattermostHandler, MattermostHandlerError
+from .asyncsender import AsyncMattermostSender
+from .asynchandler import AsyncMattermostHandler
 
 __all__ = (
     'MattermostSender',
     'MattermostError',
     'MattermostSenderThreaded',
+    'RetryPolicy',
+    'CircuitBreaker',
     'MattermostHandler',
-    'MattermostHandlerError'
+    'MattermostHandlerError',
+    'CircuitOpenError',
+    'AsyncMattermostSender',
+    'AsyncMattermostHandler',
 )
 
 
 # Don't export the modules themselfes (and ignore mypy errors)
-del sender      # type: ignore
-del threaded    # type: ignore
-del handler     # type: ignore
+del connection      # type: ignore
+del sender          # type: ignore
+del threaded        # type: ignore
+del ratelimit       # type: ignore
+del retry           # type: ignore
+del breaker         # type: ignore
+del handler         # type: ignore
+del asyncsender     # type: ignore
+del asynchandler    # type: ignore
 
 
 
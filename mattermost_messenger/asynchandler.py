@@ -0,0 +1,199 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Special :py:class:`logging.Handler` sending log messages to Mattermost with
+:py:class:`AsyncMattermostSender` on a running :py:mod:`asyncio` event loop
+"""
+
+
+import asyncio
+import logging
+from typing import Optional
+from .asyncsender import AsyncMattermostSender, defaultConcurrency
+from .handler import _MattermostHandlerBase, defaultEmojis
+from .sender import MattermostError
+
+
+
+class AsyncMattermostHandler(_MattermostHandlerBase):
+    """:py:class:`logging.Handler` sending its messages to a Mattermost webhook from an event loop
+
+    Unlike :py:class:`MattermostHandler` this class doesn't start a thread.
+    The handler binds to the running event loop on the first call of
+    :py:meth:`emit` and sends the records with a consumer task on that loop.
+    :py:meth:`emit` may also be called from other threads once the handler is
+    bound, the records are then passed to the loop thread-safely. Records
+    emitted before binding while no event loop is running are reported as
+    error.
+
+    Await :py:meth:`aclose` before the event loop terminates to send the
+    remaining messages. :py:meth:`close`, as called by :py:func:`logging.shutdown`,
+    only signals the consumer task to terminate.
+
+    Errors are handled like in :py:class:`MattermostHandler`.
+    """
+
+    def __init__(self, url:str, *,
+                 name:str='AsyncMattermostHandler',
+                 level:int=logging.NOTSET,
+                 queueSize:Optional[int]=None,
+                 timeout:Optional[float]=None,
+                 errorLogger:Optional[logging.Logger]=None,
+                 emojis:dict[int, str]=defaultEmojis,
+                 channel:Optional[str]=None,
+                 proxy:Optional[str]=None,
+                 concurrency:int=defaultConcurrency,
+                 ):
+        """
+        :param url:         URL of the Mattermost webhook
+        :param name:        Name to distinguish multiple handler instances
+        :param level:       Minimum log level, see :py:class:`MattermostHandler`
+        :param queueSize:   Max size of the queue for records to send,
+                            :py:const:`None` means unlimited
+        :param timeout:     Passed to :py:class:`AsyncMattermostSender`
+        :param errorLogger: Logger to be notified about internal errors, see :py:meth:`_error`
+        :param emojis:      :py:class:`dict` assigning log levels to Mattermost emojis, see :py:meth:`_getEmoji`
+        :param channel:     Passed to :py:class:`AsyncMattermostSender`
+        :param proxy:       Passed to :py:class:`AsyncMattermostSender`
+        :param concurrency: Passed to :py:class:`AsyncMattermostSender`
+        """
+        super().__init__(name=name, level=level, errorLogger=errorLogger, emojis=emojis)
+        self._sender = AsyncMattermostSender(url, timeout=timeout, channel=channel, proxy=proxy,
+                                             concurrency=concurrency)
+        self._queueSize = queueSize if queueSize else 0
+        self._loop:Optional[asyncio.AbstractEventLoop] = None
+        self._queue:Optional[asyncio.Queue] = None
+        self._consumer:Optional[asyncio.Task] = None
+        self._pending:set[asyncio.Task] = set()
+        self._isClosing = False
+
+
+    def _bind(self) -> bool:
+        """Bind to the running event loop and start the consumer task
+
+        :return: :py:const:`False` if no event loop is running
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self._queueSize)
+        self._consumer = loop.create_task(self._consume(), name=self.name)
+        return True
+
+
+    def _isInLoop(self) -> bool:
+        """:return: :py:const:`True` if called in the thread running the bound event loop"""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+
+    def emit(self, record:logging.LogRecord) -> None:
+        """Overridden :py:meth:`Handler.emit` putting the record into the queue of the event loop
+
+        :param record: :py:class:`logging.LogRecord` to log
+
+        The record is formatted and its emoji is determined in the calling
+        thread, see :py:meth:`MattermostHandler.emit`.
+        """
+        if self._isClosing:
+            self._error(record, f"AsyncMattermostHandler '{self.name}' received a record although it is closed")
+            return
+        if self._loop is None and not self._bind():
+            self._error(record, f"AsyncMattermostHandler '{self.name}' received a record "
+                                "before an event loop was running")
+            return
+
+        item = (self.format(record), self._getEmoji(record.levelno), record)
+        if self._isInLoop():
+            self._enqueue(item)
+            return
+        assert self._loop is not None
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, item)
+        except RuntimeError as ex:
+            self._error(record, f"Event loop of AsyncMattermostHandler '{self.name}' is closed: {ex}")
+
+
+    def _enqueue(self, item:tuple[str, Optional[str], logging.LogRecord]) -> None:
+        """Put an item into the queue, called in the event loop"""
+        assert self._queue is not None
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._error(item[2], f"Message queue of '{self.name}' full. Consider to "
+                                 "increase the queueSize passed to AsyncMattermostHandler.")
+
+
+    async def _consume(self) -> None:
+        """Consumer task sending queued items with up to :py:attr:`AsyncMattermostSender.concurrency` tasks
+
+        Terminates on a :py:const:`None` item after all running send tasks finished.
+        """
+        assert self._queue is not None
+        slots = asyncio.Semaphore(self._sender.concurrency)
+        while (item := await self._queue.get()) is not None:
+            await slots.acquire()
+            task = asyncio.create_task(self._sendItem(item, slots))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        await self._sender.close()
+
+
+    async def _sendItem(self, item:tuple[str, Optional[str], logging.LogRecord],
+                        slots:asyncio.Semaphore) -> None:
+        """Send one item and report errors with :py:meth:`_error`"""
+        msg, emoji, record = item
+        try:
+            await self._sender.send(msg, emoji=emoji)
+        except MattermostError as ex:
+            emojiMsg = f" with emoji '{emoji}'" if emoji else ""
+            self._error(record, f"Error in '{self.name}' sending message \"{msg}\"{emojiMsg}: \"{ex}\"")
+        finally:
+            slots.release()
+
+
+    def _signalStop(self) -> None:
+        """Put the termination item into the queue, called in the event loop"""
+        assert self._queue is not None
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            asyncio.ensure_future(self._queue.put(None))
+
+
+    async def aclose(self) -> None:
+        """Send all queued records, then close the handler
+
+        Has to be awaited on the bound event loop.
+        """
+        if self._consumer is not None and not self._isClosing:
+            self._isClosing = True
+            assert self._queue is not None
+            await self._queue.put(None)
+        if self._consumer is not None:
+            await self._consumer
+        self.close()
+
+
+    def close(self) -> None:
+        """Signal the consumer task to terminate without waiting
+
+        This will also be called by :py:func:`logging.shutdown`. Messages are
+        still sent as long as the event loop keeps running.
+        """
+        if self._consumer is not None and not self._isClosing:
+            self._isClosing = True
+            assert self._loop is not None
+            if self._isInLoop():
+                self._signalStop()
+            elif not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._signalStop)
+        self._isClosing = True
+        super().close()
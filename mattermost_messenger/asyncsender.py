@@ -0,0 +1,350 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Class :py:class:`AsyncMattermostSender` for sending messages to Mattermost
+with :py:mod:`asyncio`
+"""
+
+
+import ssl
+import time
+import socket
+import asyncio
+from typing import Optional
+from urllib.parse import urlsplit
+from http import HTTPStatus
+from http.client import responses
+from .sender import _MattermostSenderBase, MattermostError, defaultIdleTimeout
+from .ratelimit import getRateLimiter, parseRetryAfter, defaultRateLimitRetries
+
+
+
+defaultConcurrency:int = 4
+"""Default maximum number of concurrent requests of :py:class:`AsyncMattermostSender`"""
+
+_maxHeaderLines = 100
+"""Maximum number of header lines accepted in an http response"""
+
+
+
+class _AsyncConnection:
+    """Stream pair of one open connection with the time of its last use"""
+
+    def __init__(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.lastUsed = time.monotonic()
+
+
+    def isUsable(self, idleTimeout:Optional[float]) -> bool:
+        """:return: :py:const:`False` if the connection expired or was closed by the server"""
+        if idleTimeout is not None and time.monotonic() - self.lastUsed > idleTimeout:
+            return False
+        return not (self.reader.at_eof() or self.writer.is_closing())
+
+
+    def close(self) -> None:
+        """Close the connection without waiting"""
+        self.writer.close()
+
+
+
+class AsyncMattermostSender(_MattermostSenderBase):
+    """Variation of :py:class:`MattermostSender` for :py:mod:`asyncio`
+
+    :py:meth:`send` is a coroutine that posts the message on a kept-alive
+    connection opened with :py:func:`asyncio.open_connection`. Up to
+    :py:obj:`concurrency` messages are sent concurrently, each on its own
+    connection. Further calls wait until a connection becomes free.
+
+    Call :py:meth:`close` when done or use the instance in an async with
+    statement:
+
+    .. code-block:: python
+
+        async with AsyncMattermostSender(webhook) as sender:
+            await sender.send(msg)
+
+    A proxy is applied with an http CONNECT tunnel like :py:class:`MattermostSender` does.
+    """
+
+    def __init__(self, url:str, *, timeout:Optional[float]=None, defaultEmoji:Optional[str]=None,
+                 channel:Optional[str]=None, proxy:Optional[str]=None,
+                 concurrency:int=defaultConcurrency,
+                 idleTimeout:Optional[float]=defaultIdleTimeout,
+                 rateLimitRetries:int=defaultRateLimitRetries):
+        """
+        :param url:          Passed to :py:class:`MattermostSender`
+        :param timeout:      Passed to :py:class:`MattermostSender`
+        :param defaultEmoji: Passed to :py:class:`MattermostSender`
+        :param channel:      Passed to :py:class:`MattermostSender`
+        :param proxy:        Passed to :py:class:`MattermostSender`
+        :param concurrency:  Maximum number of concurrent requests
+        :param idleTimeout:  Seconds after which an unused connection is closed
+                             instead of being reused. :py:const:`None` disables
+                             the check.
+        :param rateLimitRetries: Passed to :py:class:`MattermostSender`
+        """
+        super().__init__(url, timeout=timeout, defaultEmoji=defaultEmoji, channel=channel, proxy=proxy)
+        if concurrency < 1:
+            raise ValueError(f"Concurrency must be at least 1, got {concurrency}")
+        splitResult = urlsplit(self._url, scheme='https')
+        assert isinstance(splitResult.hostname, str)
+        self._hostname = splitResult.hostname
+        self._port = splitResult.port or (443 if self._isHttps else 80)
+        self._path = splitResult.path or '/'
+        if splitResult.query:
+            self._path += '?' + splitResult.query
+        self._concurrency = concurrency
+        self._idleTimeout = idleTimeout
+        self._idle:list[_AsyncConnection] = []
+        self._semaphore:Optional[asyncio.Semaphore] = None
+        self._sslContext:Optional[ssl.SSLContext] = None
+        self._rateLimiter = getRateLimiter(self._host)
+        self._rateLimitRetries = rateLimitRetries
+
+
+    @property
+    def concurrency(self) -> int:
+        """Maximum number of concurrent requests"""
+        return self._concurrency
+
+
+    async def __aenter__(self):
+        """:return: :py:class:`self`"""
+        return self
+
+
+    async def __aexit__(self, excType, excValue, traceback) -> None:
+        """Calls :py:meth:`close` on leaving the context"""
+        await self.close()
+
+
+    async def close(self) -> None:
+        """Close all idle connections"""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+        for connection in idle:
+            try:
+                await connection.writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+
+    def _getSslContext(self) -> Optional[ssl.SSLContext]:
+        """:return: SSL context for https webhooks, created on first use"""
+        if not self._isHttps:
+            return None
+        if self._sslContext is None:
+            self._sslContext = ssl.create_default_context()
+        return self._sslContext
+
+
+    async def _openTunnelSocket(self) -> socket.socket:
+        """Open a socket to the proxy and establish a CONNECT tunnel to the webhook host
+
+        :return: non-blocking socket connected through the tunnel
+        :raise MattermostError: if the proxy rejects the tunnel
+        """
+        assert self._proxy
+        loop = asyncio.get_running_loop()
+        proxyParts = urlsplit(self._proxy)
+        assert isinstance(proxyParts.hostname, str)
+        proxyPort = proxyParts.port or 80
+        addresses = await loop.getaddrinfo(proxyParts.hostname, proxyPort, type=socket.SOCK_STREAM)
+
+        lastError:Optional[OSError] = None
+        for family, sockType, proto, _, address in addresses:
+            sock = socket.socket(family, sockType, proto)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, address)
+                break
+            except OSError as ex:
+                sock.close()
+                lastError = ex
+        else:
+            raise lastError if lastError else MattermostError(f"Cannot resolve proxy {self._proxy}")
+
+        try:
+            target = f'{self._hostname}:{self._port}'
+            request = f'CONNECT {target} HTTP/1.1\r\nHost: {target}\r\n\r\n'
+            await loop.sock_sendall(sock, request.encode('ascii'))
+            reply = b''
+            while b'\r\n\r\n' not in reply:
+                chunk = await loop.sock_recv(sock, 4096)
+                if not chunk:
+                    raise MattermostError(f"Proxy {self._proxy} closed the connection during CONNECT")
+                reply += chunk
+            statusLine = reply.split(b'\r\n', 1)[0].decode('latin-1')
+            parts = statusLine.split(None, 2)
+            if len(parts) < 2 or parts[1] != str(int(HTTPStatus.OK)):
+                raise MattermostError(f"Proxy {self._proxy} rejected tunnel: {statusLine}")
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+
+    async def _openConnection(self) -> _AsyncConnection:
+        """Open a new connection to the webhook, through the proxy if configured"""
+        sslContext = self._getSslContext()
+        serverHostname = self._hostname if sslContext else None
+        if self._proxy:
+            sock = await self._openTunnelSocket()
+            reader, writer = await asyncio.open_connection(sock=sock, ssl=sslContext,
+                                                           server_hostname=serverHostname)
+        else:
+            reader, writer = await asyncio.open_connection(self._hostname, self._port, ssl=sslContext,
+                                                           server_hostname=serverHostname)
+        return _AsyncConnection(reader, writer)
+
+
+    def _takeIdleConnection(self) -> Optional[_AsyncConnection]:
+        """:return: a usable idle connection or :py:const:`None` if there is none"""
+        while self._idle:
+            connection = self._idle.pop()
+            if connection.isUsable(self._idleTimeout):
+                return connection
+            connection.close()
+        return None
+
+
+    def _makeRequest(self, msg:str, emoji:Optional[str], channel:Optional[str]) -> bytes:
+        """Create the complete http request including :py:meth:`_makeHttpBody`"""
+        body = self._makeHttpBody(msg, emoji, channel).encode('utf-8')
+        head = (f'POST {self._path} HTTP/1.1\r\n'
+                f'Host: {self._host}\r\n'
+                'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                '\r\n')
+        return head.encode('latin-1') + body
+
+
+    @staticmethod
+    async def _readResponse(reader:asyncio.StreamReader) -> tuple[int, bool, dict[str, str]]:
+        """Read an http response and discard its body
+
+        :return: http status, whether the server closes the connection, and the
+                 headers with lower case names
+        :raise asyncio.IncompleteReadError: if the connection was closed before a response
+        """
+        statusLine = await reader.readuntil(b'\r\n')
+        parts = statusLine.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise MattermostError(f"Invalid http status line from Mattermost: {statusLine!r}")
+        status = int(parts[1])
+        willClose = parts[0] == 'HTTP/1.0'
+
+        contentLength:Optional[int] = None
+        isChunked = False
+        headers:dict[str, str] = {}
+        for _ in range(_maxHeaderLines):
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = value
+            value = value.lower()
+            if name == 'content-length':
+                contentLength = int(value)
+            elif name == 'transfer-encoding':
+                isChunked = 'chunked' in value
+            elif name == 'connection':
+                willClose = 'close' in value
+        else:
+            raise MattermostError("Too many header lines in http response from Mattermost")
+
+        if isChunked:
+            while size := int((await reader.readuntil(b'\r\n')).split(b';', 1)[0], 16):
+                await reader.readexactly(size + 2)
+            # Skip trailer
+            while await reader.readuntil(b'\r\n') != b'\r\n':
+                pass
+        elif contentLength is not None:
+            await reader.readexactly(contentLength)
+        else:
+            await reader.read()
+            willClose = True
+        return status, willClose, headers
+
+
+    async def _post(self, connection:_AsyncConnection, request:bytes) -> tuple[int, dict[str, str]]:
+        """Send request on a connection and return the http status and headers
+
+        Closes :py:obj:`connection` on any exception or if the server announced
+        to close it, otherwise it is put into the idle list.
+        """
+        try:
+            connection.writer.write(request)
+            await connection.writer.drain()
+            status, willClose, headers = await self._readResponse(connection.reader)
+        except BaseException:
+            connection.close()
+            raise
+        if willClose:
+            connection.close()
+        else:
+            connection.lastUsed = time.monotonic()
+            self._idle.append(connection)
+        return status, headers
+
+
+    async def _sendRequest(self, request:bytes) -> tuple[int, dict[str, str]]:
+        """Send request on an idle or new connection
+
+        If a reused connection turns out to be closed by the server, the
+        request is sent once more on a new connection.
+        """
+        connection = self._takeIdleConnection()
+        if connection is not None:
+            try:
+                return await self._post(connection, request)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # Server closed the kept-alive connection meanwhile
+                pass
+
+        return await self._post(await self._openConnection(), request)
+
+
+    async def send(self, msg:str, *, emoji:Optional[str]=None, channel:Optional[str]=None) -> None:
+        """Send message to Mattermost
+
+        :param msg:     message to send
+        :param emoji:   passed to :py:meth:`_makeHttpBody`
+        :param channel: passed to :py:meth:`_makeHttpBody`
+        :raise MattermostError: on any error
+
+        Waits until one of the :py:obj:`concurrency` slots is free. Pacing and
+        retries on http status 429 work like in :py:meth:`MattermostSender._postMessage`.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+
+        request = self._makeRequest(msg, emoji, channel)
+        try:
+            async with self._semaphore:
+                for attempt in range(self._rateLimitRetries + 1):
+                    delay = self._rateLimiter.reserve()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    status, headers = await asyncio.wait_for(self._sendRequest(request), timeout=self.timeout)
+                    self._rateLimiter.update(headers)
+                    if HTTPStatus.TOO_MANY_REQUESTS != status:
+                        break
+                    self._rateLimiter.backOff(parseRetryAfter(headers.get('retry-after')))
+        except MattermostError:
+            raise
+        except asyncio.TimeoutError as ex:
+            raise MattermostError(f"Sending a message timed out after {self.timeout} s") from ex
+        except Exception as ex:
+            raise MattermostError(f"Sending a message raised an exception of type {type(ex)}: {ex}") from ex
+
+        if HTTPStatus.OK != status:
+            raise MattermostError(f"Mattermost replied with http status "
+                        f"{status} ({responses.get(status, 'Unknown')})",
+                        status=status
+            )
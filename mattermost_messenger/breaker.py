@@ -0,0 +1,186 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Class :py:class:`CircuitBreaker` stopping requests to an unavailable Mattermost server
+"""
+
+
+import time
+import threading
+from typing import Optional
+from collections.abc import Callable
+from .sender import MattermostError, CircuitOpenError
+
+
+
+defaultFailureThreshold:int = 5
+"""Default number of successive failures opening a :py:class:`CircuitBreaker`"""
+
+defaultProbeInterval:float = 30
+"""Default seconds an open :py:class:`CircuitBreaker` waits before letting a probe request pass"""
+
+stateClosed = 'closed'
+"""State of a :py:class:`CircuitBreaker` letting all requests pass"""
+
+stateOpen = 'open'
+"""State of a :py:class:`CircuitBreaker` rejecting all requests"""
+
+stateHalfOpen = 'half-open'
+"""State of a :py:class:`CircuitBreaker` letting a single probe request pass"""
+
+
+
+class CircuitBreaker:
+    """Circuit breaker protecting senders from waiting for timeouts during outages
+
+    The breaker starts closed and lets all requests pass. After
+    :py:obj:`failureThreshold` successive failures it opens and rejects all
+    requests, see :py:meth:`allow`. After :py:obj:`probeInterval` seconds it
+    becomes half-open and lets one probe request pass. A successful probe
+    closes the breaker, a failed one opens it again for another interval.
+
+    Only failures indicating an outage count, see :py:meth:`isOutage`.
+    A breaker may be shared by several senders to the same server. It is
+    thread-safe. Listeners added with :py:meth:`addListener` are called with
+    the old and the new state on every state change.
+    """
+
+    def __init__(self, *, failureThreshold:int=defaultFailureThreshold,
+                 probeInterval:float=defaultProbeInterval):
+        """
+        :param failureThreshold: Number of successive failures opening the breaker
+        :param probeInterval:    Seconds to wait before a probe request when open
+        """
+        if failureThreshold < 1:
+            raise ValueError(f"Failure threshold must be at least 1, got {failureThreshold}")
+        self._failureThreshold = failureThreshold
+        self._probeInterval = probeInterval
+        self._state = stateClosed
+        self._failures = 0
+        self._openedAt = 0.0
+        self._isProbing = False
+        self._listeners:list[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+
+
+    @property
+    def state(self) -> str:
+        """Current state, one of :py:data:`stateClosed`, :py:data:`stateOpen`, and :py:data:`stateHalfOpen`"""
+        return self._state
+
+
+    @property
+    def failureThreshold(self) -> int:
+        """Number of successive failures opening the breaker"""
+        return self._failureThreshold
+
+
+    @property
+    def probeInterval(self) -> float:
+        """Seconds to wait before a probe request when open"""
+        return self._probeInterval
+
+
+    def addListener(self, listener:Callable[[str, str], None]) -> None:
+        """Add a function to be called with the old and new state on state changes"""
+        with self._lock:
+            self._listeners.append(listener)
+
+
+    def removeListener(self, listener:Callable[[str, str], None]) -> None:
+        """Remove a function added by :py:meth:`addListener`, ignored if not added"""
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+
+    @staticmethod
+    def isOutage(ex:MattermostError) -> bool:
+        """Classify an error
+
+        :param ex: error raised on sending
+        :return:   :py:const:`True` for network errors and http statuses 5xx,
+                   which count as failure. Other errors like an invalid message
+                   don't say anything about the availability of the server.
+        """
+        return not isinstance(ex, CircuitOpenError) and (ex.status is None or ex.status >= 500)
+
+
+    def _setState(self, state:str) -> Optional[tuple[str, str]]:
+        """Change the state, call with lock held
+
+        :return: old and new state for :py:meth:`_notify` or :py:const:`None` if unchanged
+        """
+        if state == self._state:
+            return None
+        change = (self._state, state)
+        self._state = state
+        return change
+
+
+    def _notify(self, change:Optional[tuple[str, str]]) -> None:
+        """Call the listeners about a state change returned by :py:meth:`_setState`, call without lock"""
+        if change is None:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener(*change)
+
+
+    def retryAfter(self) -> float:
+        """:return: seconds until a request may pass, 0 if closed or a probe is allowed"""
+        with self._lock:
+            if self._state == stateClosed:
+                return 0.0
+            if self._state == stateHalfOpen and not self._isProbing:
+                return 0.0
+            return max(0.0, self._openedAt + self._probeInterval - time.monotonic())
+
+
+    def allow(self) -> bool:
+        """Check if a request may be sent
+
+        :return: :py:const:`True` if closed or if the request is the probe
+                 request. The caller has to report the result of an allowed
+                 request with :py:meth:`recordSuccess` or :py:meth:`recordFailure`.
+        """
+        change = None
+        with self._lock:
+            if self._state == stateClosed:
+                return True
+            now = time.monotonic()
+            if self._state == stateOpen and now >= self._openedAt + self._probeInterval:
+                # Wait another interval for the result of the probe
+                self._openedAt = now
+                change = self._setState(stateHalfOpen)
+            isAllowed = self._state == stateHalfOpen and not self._isProbing
+            if isAllowed:
+                self._isProbing = True
+        self._notify(change)
+        return isAllowed
+
+
+    def recordSuccess(self) -> None:
+        """Report a successful request, closes the breaker"""
+        with self._lock:
+            self._failures = 0
+            self._isProbing = False
+            change = self._setState(stateClosed)
+        self._notify(change)
+
+
+    def recordFailure(self) -> None:
+        """Report a failed request
+
+        Opens the breaker after :py:obj:`failureThreshold` successive failures
+        or if the probe request failed.
+        """
+        change = None
+        with self._lock:
+            self._failures += 1
+            if self._state == stateHalfOpen or self._failures >= self._failureThreshold:
+                self._isProbing = False
+                self._openedAt = time.monotonic()
+                change = self._setState(stateOpen)
+        self._notify(change)
@@ -0,0 +1,192 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Class :py:class:`ConnectionPool` managing reusable http connections to a
+Mattermost server
+
+Pools are shared process-wide per destination, see :py:func:`getConnectionPool`.
+"""
+
+
+import time
+import select
+import threading
+from typing import Optional
+from urllib.parse import urlsplit
+from http.client import HTTPConnection, HTTPSConnection
+
+
+
+defaultPoolSize:int = 4
+"""Default maximum number of connections of a :py:class:`ConnectionPool`"""
+
+
+
+class ConnectionPoolTimeout(Exception):
+    """Exception raised if no connection becomes available in time"""
+
+
+
+class ConnectionPool:
+    """Bounded thread-safe pool of http connections to one destination
+
+    A destination is defined by scheme, host, and proxy. Connections are
+    checked out with :py:meth:`acquire` for exclusive use by one thread and
+    given back with :py:meth:`release`. At most :py:attr:`maxSize` connections
+    exist at the same time, :py:meth:`acquire` blocks if all of them are in use.
+
+    Idle connections are checked before being handed out. They are dropped if
+    they were idle for too long or if the server closed them meanwhile.
+    """
+
+    def __init__(self, isHttps:bool, host:str, proxy:Optional[str], *, maxSize:int=defaultPoolSize):
+        """
+        :param isHttps: Use https if :py:const:`True`, else http
+        :param host:    Host (including optional port) of the destination
+        :param proxy:   Address (including port) of a proxy server or :py:const:`None`
+        :param maxSize: Maximum number of connections
+        """
+        if maxSize < 1:
+            raise ValueError(f"Connection pool size must be at least 1, got {maxSize}")
+        self._isHttps = isHttps
+        self._host = host
+        self._proxy = proxy
+        self.maxSize = maxSize
+        self._idle:list[tuple[HTTPConnection, float]] = []
+        self._inUse = 0
+        self._condition = threading.Condition(threading.Lock())
+
+
+    @property
+    def key(self) -> tuple[str, str, Optional[str]]:
+        """Key (scheme, host, proxy) identifying the destination of the pool"""
+        return ('https' if self._isHttps else 'http', self._host, self._proxy)
+
+
+    def _createConnection(self, timeout:float) -> HTTPConnection:
+        """Create a new, not yet opened connection
+
+        :param timeout: Timeout for the connection
+        """
+        ConnectionClass = HTTPSConnection if self._isHttps else HTTPConnection
+
+        if self._proxy:
+            proxyParts = urlsplit(self._proxy)
+            assert isinstance(proxyParts.hostname, str)
+            connection = ConnectionClass(proxyParts.hostname, port=proxyParts.port, timeout=timeout)
+            connection.set_tunnel(self._host)
+            return connection
+        return ConnectionClass(self._host, timeout=timeout)
+
+
+    @staticmethod
+    def _isHealthy(connection:HTTPConnection) -> bool:
+        """Check whether an idle connection can be reused
+
+        :param connection: idle connection
+        :return:           :py:const:`False` if the socket of :py:obj:`connection`
+                           is readable, which means that the server closed it or
+                           sent unexpected data
+        """
+        if connection.sock is None:
+            # Socket is opened on next request
+            return True
+        try:
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+
+    def acquire(self, timeout:float, idleTimeout:Optional[float]=None) -> HTTPConnection:
+        """Check out a connection for exclusive use
+
+        :param timeout:     Timeout for the connection and for waiting until a
+                            connection is available
+        :param idleTimeout: Idle connections unused for longer than this are
+                            dropped, :py:const:`None` disables the check
+        :return:            a healthy idle connection or a new connection
+        :raise ConnectionPoolTimeout: if no connection is available in time
+
+        Any exception from creating a new connection is passed on.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    connection, lastUsed = self._idle.pop()
+                    isExpired = idleTimeout is not None and now - lastUsed > idleTimeout
+                    if isExpired or not self._isHealthy(connection):
+                        connection.close()
+                        continue
+                    self._inUse += 1
+                    connection.timeout = timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(timeout)
+                    return connection
+
+                if self._inUse < self.maxSize:
+                    connection = self._createConnection(timeout)
+                    self._inUse += 1
+                    return connection
+
+                remaining = deadline - now
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise ConnectionPoolTimeout(f"No connection to {self._host} available "
+                                                f"within {timeout} s, all {self.maxSize} "
+                                                "connections of the pool are in use")
+
+
+    def release(self, connection:HTTPConnection, *, reuse:bool=True) -> None:
+        """Give back a connection checked out with :py:meth:`acquire`
+
+        :param connection: the connection
+        :param reuse:      If :py:const:`False` the connection is closed instead
+                           of being kept for reuse
+        """
+        if not reuse:
+            connection.close()
+        with self._condition:
+            self._inUse -= 1
+            if reuse:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+
+    def closeIdle(self) -> None:
+        """Close all idle connections"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+
+
+_pools:dict[tuple[str, str, Optional[str]], ConnectionPool] = {}
+"""Process-wide pools by :py:attr:`ConnectionPool.key`"""
+
+_poolsLock = threading.Lock()
+
+
+
+def getConnectionPool(isHttps:bool, host:str, proxy:Optional[str], *, maxSize:int=defaultPoolSize) -> ConnectionPool:
+    """Get the shared :py:class:`ConnectionPool` for a destination
+
+    :param isHttps: see :py:class:`ConnectionPool`
+    :param host:    see :py:class:`ConnectionPool`
+    :param proxy:   see :py:class:`ConnectionPool`
+    :param maxSize: Minimum required size of the pool. An existing pool is
+                    enlarged if it is smaller.
+    :return:        the pool, which is created on first request
+    """
+    key = ('https' if isHttps else 'http', host, proxy)
+    with _poolsLock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(isHttps, host, proxy, maxSize=maxSize)
+        elif pool.maxSize < maxSize:
+            with pool._condition:
+                pool.maxSize = maxSize
+                pool._condition.notify_all()
+        return pool
@@ -10,6 +10,9 @@ import logging
 from typing import Optional, Any
 from .threaded import MattermostSenderThreaded
 from .sender import MattermostError
+from .connection import defaultPoolSize
+from .retry import RetryPolicy
+from .breaker import CircuitBreaker
 
 
 
@@ -27,8 +30,8 @@ class MattermostHandlerError(MattermostError):
 
 
 
-class MattermostHandler(logging.Handler):
-    """:py:class:`logging.Handler` sending its messages to a Mattermost webhook
+class _MattermostHandlerBase(logging.Handler):
+    """Common error handling and emoji selection of Mattermost logging handlers
 
     An error logger that contains :py:obj:`self` directly or indirectly as
     handler will raise a :py:exc:`MattermostHandlerError` exception when used,
@@ -37,42 +40,18 @@ class MattermostHandler(logging.Handler):
     to :py:const:`None`.
     """
 
-    def __init__(self, url:str, *,
-                 name:str='MattermostHandler',
-                 level:int=logging.NOTSET,
-                 queueSize:Optional[int]=None,
-                 timeout:Optional[float]=None,
-                 errorLogger:Optional[logging.Logger]=None,
-                 emojis:dict[int, str]=defaultEmojis,
-                 channel:Optional[str]=None,
-                 proxy:Optional[str]=None,
-                 ):
+    def __init__(self, *, name:str, level:int, errorLogger:Optional[logging.Logger],
+                 emojis:dict[int, str]):
         """
-        :param url:         URL of the Mattermost webhook
-        :param name:        Name to distinguish multiple :py:class:`MattermostHandler` instances
-        :param level:       Minimum log level, if set to :py:const:`logging.NOTSET`
-                            (default) it inherits the log level of the Logger this
-                            handler is added to
-        :param timeout:     Passed to :py:class:`MattermostSenderThreaded`
+        :param name:        Name to distinguish multiple handler instances
+        :param level:       Minimum log level, see :py:class:`logging.Handler`
         :param errorLogger: Logger to be notified about internal errors, see :py:meth:`_error`
-        :param queueSize:   Passed to :py:class:`MattermostSenderThreaded`
         :param emojis:      :py:class:`dict` assigning log levels to Mattermost emojis, see :py:meth:`_getEmoji`
-        :param channel:     Passed to :py:class:`MattermostSenderThreaded`
-        :param proxy:       Passed to :py:class:`MattermostSenderThreaded`
         """
         super().__init__(level)
         self.name = name
         self.errorLogger = errorLogger
         self._emojis = emojis
-        self._sender = MattermostSenderThreaded(
-            url=url,
-            errorCallback=self._threadErrorCallback,
-            timeout=timeout,
-            channel=channel,
-            proxy=proxy,
-            queueSize=queueSize,
-            name=name,
-        )
 
 
     def _isSelfInLogger(self, logger:Optional[logging.Logger]) -> bool:
@@ -117,32 +96,6 @@ class MattermostHandler(logging.Handler):
         self._errorLogger = None
 
 
-    def close(self) -> None:
-        """Shut down internal :py:class:`MattermostSenderThreaded` object
-
-        This will also be called by :py:meth:`logging.shutdown`.
-        """
-        self._sender.shutdown()
-        super().close()
-
-
-    def _threadErrorCallback(self, data:object, msg:str) -> None:
-        """Passed to internal :py:class:`MattermostSenderThreaded` object as error callback
-
-        :param data: optional record that caused the error
-        :param msg:  error message from :py:class:`MattermostSenderThreaded`
-                     passed to :py:meth:`_error`
-
-        :py:meth:`emit` passes the record as data to :py:meth:`MattermostSenderThreaded.send`
-        so we assume that data is either the :py:class:`logging.LogRecord` of the message causing
-        the error or :py:const:`None`.
-
-        Calls :py:meth:`_error` with the record in :py:obj:`data`.
-        """
-        assert isinstance(data, logging.LogRecord) or data is None
-        self._error(record=data, msg=msg)
-
-
     def _error(self, record:Optional[logging.LogRecord], msg:str) -> None:
         """Handle error when sending a message failed
 
@@ -198,6 +151,99 @@ class MattermostHandler(logging.Handler):
         return result
 
 
+
+class MattermostHandler(_MattermostHandlerBase):
+    """:py:class:`logging.Handler` sending its messages to a Mattermost webhook
+
+    An error logger that contains :py:obj:`self` directly or indirectly as
+    handler will raise a :py:exc:`MattermostHandlerError` exception when used,
+    see :py:meth:`_error`. The errorlogger can be changed at any time by assigning to
+    :py:attr:`errorLogger` property. To remove the error logger set it
+    to :py:const:`None`.
+    """
+
+    def __init__(self, url:str, *,
+                 name:str='MattermostHandler',
+                 level:int=logging.NOTSET,
+                 queueSize:Optional[int]=None,
+                 timeout:Optional[float]=None,
+                 errorLogger:Optional[logging.Logger]=None,
+                 emojis:dict[int, str]=defaultEmojis,
+                 channel:Optional[str]=None,
+                 proxy:Optional[str]=None,
+                 poolSize:int=defaultPoolSize,
+                 coalesce:bool=False,
+                 workers:int=1,
+                 retry:Optional[RetryPolicy]=None,
+                 circuitBreaker:Optional[CircuitBreaker]=None,
+                 ):
+        """
+        :param url:         URL of the Mattermost webhook
+        :param name:        Name to distinguish multiple :py:class:`MattermostHandler` instances
+        :param level:       Minimum log level, if set to :py:const:`logging.NOTSET`
+                            (default) it inherits the log level of the Logger this
+                            handler is added to
+        :param timeout:     Passed to :py:class:`MattermostSenderThreaded`
+        :param errorLogger: Logger to be notified about internal errors, see :py:meth:`_error`
+        :param queueSize:   Passed to :py:class:`MattermostSenderThreaded`
+        :param emojis:      :py:class:`dict` assigning log levels to Mattermost emojis, see :py:meth:`_getEmoji`
+        :param channel:     Passed to :py:class:`MattermostSenderThreaded`
+        :param proxy:       Passed to :py:class:`MattermostSenderThreaded`
+        :param poolSize:    Passed to :py:class:`MattermostSenderThreaded`
+        :param coalesce:    Passed to :py:class:`MattermostSenderThreaded`
+        :param workers:     Passed to :py:class:`MattermostSenderThreaded`
+        :param retry:       Passed to :py:class:`MattermostSenderThreaded`
+        :param circuitBreaker: Passed to :py:class:`MattermostSenderThreaded`
+        """
+        super().__init__(name=name, level=level, errorLogger=errorLogger, emojis=emojis)
+        self._sender = MattermostSenderThreaded(
+            url=url,
+            errorCallback=self._threadErrorCallback,
+            timeout=timeout,
+            channel=channel,
+            proxy=proxy,
+            queueSize=queueSize,
+            name=name,
+            poolSize=poolSize,
+            coalesce=coalesce,
+            workers=workers,
+            retry=retry,
+            circuitBreaker=circuitBreaker,
+        )
+
+
+    @property
+    def poolSize(self) -> int:
+        """Maximum number of connections, see :py:attr:`MattermostSender.poolSize`"""
+        return self._sender.poolSize
+
+
+    def close(self) -> None:
+        """Shut down internal :py:class:`MattermostSenderThreaded` object
+
+        This will also be called by :py:meth:`logging.shutdown`.
+        """
+        self._sender.shutdown()
+        super().close()
+
+
+    def _threadErrorCallback(self, data:object, msg:str) -> None:
+        """Passed to internal :py:class:`MattermostSenderThreaded` object as error callback
+
+        :param data: optional record that caused the error
+        :param msg:  error message from :py:class:`MattermostSenderThreaded`
+                     passed to :py:meth:`_error`
+
+        :py:meth:`emit` passes the record as data to :py:meth:`MattermostSenderThreaded.send`
+        so we assume that data is either the :py:class:`logging.LogRecord` of the message causing
+        the error or :py:const:`None`.
+
+        Calls :py:meth:`_error` with the record in :py:obj:`data`.
+        """
+        assert isinstance(data, logging.LogRecord) or data is None
+        self._error(record=data, msg=msg)
+
+
     def emit(self, record:logging.LogRecord) -> None:
         """Overridden :py:meth:`Handler.emit` calling :py:meth:`MattermostSenderThreaded.send`
 
@@ -0,0 +1,153 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Class :py:class:`RateLimiter` pacing requests to a Mattermost server
+
+Mattermost answers requests exceeding its rate limit with http status 429 and
+announces its limits in the headers ``X-Ratelimit-Limit`` (requests per second),
+``X-Ratelimit-Remaining``, and ``X-Ratelimit-Reset`` (seconds until the limit
+resets). Limiters are shared process-wide per host, see :py:func:`getRateLimiter`.
+"""
+
+
+import time
+import threading
+from typing import Optional
+from collections.abc import Mapping
+from email.utils import parsedate_to_datetime
+
+
+
+defaultRateLimitRetries:int = 3
+"""Default number of retries of a message rejected with http status 429"""
+
+defaultRetryAfter:float = 1
+"""Seconds to wait after http status 429 if the server doesn't send a Retry-After header"""
+
+
+
+def parseRetryAfter(value:Optional[str]) -> Optional[float]:
+    """Parse the value of a Retry-After header
+
+    :param value: header value, either seconds or an http date
+    :return:      seconds to wait or :py:const:`None` if :py:obj:`value` is
+                  missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+
+class RateLimiter:
+    """Token bucket learning its rate from Mattermost rate limit headers
+
+    Until the server announces a limit, requests are not paced. After that
+    the bucket refills with the announced rate and holds at most that many
+    tokens. :py:meth:`reserve` takes a token and returns the time to wait
+    before sending, so the caller can wait with a blocking or an asynchronous
+    sleep.
+    """
+
+    def __init__(self):
+        self._rate:Optional[float] = None
+        self._tokens = 0.0
+        self._lastRefill = time.monotonic()
+        self._blockedUntil = 0.0
+        self._lock = threading.Lock()
+
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Learned number of requests per second or :py:const:`None` if unknown"""
+        return self._rate
+
+
+    def _refill(self, now:float) -> None:
+        """Add tokens for the time since the last refill, call with lock held"""
+        if self._rate is not None:
+            self._tokens = min(self._rate, self._tokens + (now - self._lastRefill) * self._rate)
+        self._lastRefill = now
+
+
+    def reserve(self) -> float:
+        """Take a token for one request
+
+        :return: seconds to wait before sending the request, 0 if it may be sent right away
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(0.0, self._blockedUntil - now)
+            if self._rate is not None:
+                # Tokens may become negative to queue up waiting requests
+                self._tokens -= 1
+                if self._tokens < 0:
+                    delay = max(delay, -self._tokens / self._rate)
+            return delay
+
+
+    def update(self, headers:Mapping[str, str]) -> None:
+        """Learn limits from the rate limit headers of a response
+
+        :param headers: response headers, names are matched case-insensitively
+        """
+        values = { name.lower(): value for name, value in headers.items() }
+        try:
+            limit = float(values['x-ratelimit-limit'])
+            remaining = float(values['x-ratelimit-remaining'])
+        except (KeyError, ValueError):
+            return
+        reset = parseRetryAfter(values.get('x-ratelimit-reset'))
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._rate = limit if limit > 0 else None
+            # Keep debts of already reserved requests
+            if self._tokens >= 0:
+                self._tokens = min(remaining, self._rate) if self._rate else remaining
+            if remaining < 1 and reset:
+                self._blockedUntil = max(self._blockedUntil, now + reset)
+
+
+    def backOff(self, retryAfter:Optional[float]) -> float:
+        """Block all requests after a rejection with http status 429
+
+        :param retryAfter: seconds from the Retry-After header or :py:const:`None`
+        :return:           seconds requests are blocked from now on
+        """
+        if retryAfter is None:
+            retryAfter = defaultRetryAfter
+        with self._lock:
+            self._blockedUntil = max(self._blockedUntil, time.monotonic() + retryAfter)
+            self._tokens = min(self._tokens, 0.0)
+        return retryAfter
+
+
+
+_limiters:dict[str, RateLimiter] = {}
+"""Process-wide rate limiters by host"""
+
+_limitersLock = threading.Lock()
+
+
+
+def getRateLimiter(host:str) -> RateLimiter:
+    """Get the shared :py:class:`RateLimiter` for a host
+
+    :param host: host including optional port
+    :return:     the limiter, which is created on first request
+    """
+    with _limitersLock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = RateLimiter()
+        return limiter
@@ -0,0 +1,83 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Class :py:class:`RetryPolicy` deciding if and when a failed message is sent again
+"""
+
+
+import random
+import dataclasses
+from http.client import HTTPException
+from .sender import MattermostError
+from .connection import ConnectionPoolTimeout
+
+
+
+defaultRetryableStatuses:frozenset[int] = frozenset({408, 429, 500, 502, 503, 504})
+"""Http statuses indicating a transient problem of the server or an ingress"""
+
+defaultRetryableExceptions:tuple[type[BaseException], ...] = (OSError, HTTPException, ConnectionPoolTimeout)
+"""Exceptions causing a :py:exc:`MattermostError` that indicate a transient network problem"""
+
+
+
+@dataclasses.dataclass(frozen=True)
+class RetryPolicy:
+    """Configuration of retries of failed messages
+
+    A failed message is sent again if the :py:exc:`MattermostError` is
+    retryable, see :py:meth:`isRetryable`, and the message was sent less than
+    :py:attr:`maxAttempts` times. The delay before the next attempt doubles
+    with every attempt, see :py:meth:`delay`.
+    """
+
+    maxAttempts: int = 3
+    """Maximum number of attempts to send a message including the first one"""
+
+    baseDelay: float = 1
+    """Seconds to wait before the first retry"""
+
+    maxDelay: float = 60
+    """Maximum seconds to wait before a retry"""
+
+    jitter: float = 0.5
+    """Fraction of the delay that is randomly subtracted to spread retries of several senders"""
+
+    retryableStatuses: frozenset[int] = defaultRetryableStatuses
+    """Http statuses of :py:attr:`MattermostError.status` worth a retry"""
+
+    retryableExceptions: tuple[type[BaseException], ...] = defaultRetryableExceptions
+    """Causes of a :py:exc:`MattermostError` without status worth a retry"""
+
+
+    def __post_init__(self):
+        if self.maxAttempts < 1:
+            raise ValueError(f"Maximum number of attempts must be at least 1, got {self.maxAttempts}")
+        if not 0 <= self.jitter <= 1:
+            raise ValueError(f"Jitter must be between 0 and 1, got {self.jitter}")
+
+
+    def isRetryable(self, ex:MattermostError) -> bool:
+        """Classify an error
+
+        :param ex: error raised by :py:meth:`MattermostSender.send`
+        :return:   :py:const:`True` if sending the message again may succeed
+
+        An error with http status is retryable if the status is in
+        :py:attr:`retryableStatuses`. Otherwise, the exception that caused
+        :py:obj:`ex` has to be one of :py:attr:`retryableExceptions`.
+        """
+        if ex.status is not None:
+            return ex.status in self.retryableStatuses
+        return isinstance(ex.__cause__, self.retryableExceptions)
+
+
+    def delay(self, attempt:int) -> float:
+        """Seconds to wait after a failed attempt
+
+        :param attempt: number of the failed attempt, starting with 1
+        :return:        :py:attr:`baseDelay` doubled per further attempt, limited
+                        by :py:attr:`maxDelay` and reduced by a random :py:attr:`jitter`
+        """
+        delay = min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1))
+        return delay * (1 - self.jitter * random.random())
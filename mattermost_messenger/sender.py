@@ -11,43 +11,66 @@ https://developers.mattermost.com/integrate/webhooks/incoming
 import os
 import re
 import json
-from typing import Optional, cast
+import time
+from typing import Optional, TYPE_CHECKING, cast
 from urllib.parse import urlsplit
-from http.client import HTTPConnection, HTTPSConnection, responses
+from http.client import HTTPConnection, HTTPResponse, CannotSendRequest, RemoteDisconnected, responses
 from http import HTTPStatus
-from threading import Lock
+from .connection import getConnectionPool, defaultPoolSize
+from .ratelimit import getRateLimiter, parseRetryAfter, defaultRateLimitRetries
+
+if TYPE_CHECKING:
+    from .breaker import CircuitBreaker
 
 
 
 defaultTimeout:float = 10
 """Default timeout for :py:class:`MattermostSender`"""
 
+defaultIdleTimeout:float = 30
+"""Default idle time in seconds after which :py:class:`MattermostSender` drops a kept-alive connection"""
+
 envVarHttpsProxy = 'HTTPS_PROXY'
 envVarHttpProxy = 'HTTP_PROXY'
 envVarNoProxy = 'NO_PROXY'
 
+_staleConnectionErrors = (RemoteDisconnected, BrokenPipeError, ConnectionResetError,
+                          ConnectionAbortedError, CannotSendRequest)
+"""Exceptions indicating that the server closed a kept-alive connection"""
+
 
 
 class MattermostError(Exception):
     """Exception raised on any connection or sending problems"""
 
+    def __init__(self, *args, status:Optional[int]=None):
+        """
+        :param args:   passed to :py:class:`Exception`
+        :param status: http status replied by Mattermost if that caused the error
+        """
+        super().__init__(*args)
+        self.status = status
 
 
-class MattermostSender:
-    """Basic class to use a Mattermost webhook
 
-    This class provides methods to connect to and disconnect from Mattermost,
-    and to send messages to Mattermost.
+class CircuitOpenError(MattermostError):
+    """Exception raised instead of sending a message while a :py:class:`CircuitBreaker` is open"""
 
-    Connecting to Mattermost can also be done in a with context:
+    def __init__(self, *args, retryAfter:float):
+        """
+        :param args:       passed to :py:class:`MattermostError`
+        :param retryAfter: seconds until the circuit breaker lets a probe request pass
+        """
+        super().__init__(*args)
+        self.retryAfter = retryAfter
 
-    .. code-block:: python
 
-        with MattermostSender(webhook) as sender:
-            sender.send(msg)
-            sender.send(msg2)
 
-    In that case the connection is kept until leaving the with statement.
+class _MattermostSenderBase:
+    """Common configuration of synchronous and asynchronous senders
+
+    Holds the webhook URL, timeout, default emoji, channel, and proxy, and
+    creates the http body of messages.
     """
 
     def __init__(self, url:str, *, timeout:Optional[float]=None, defaultEmoji:Optional[str]=None,
@@ -69,8 +92,6 @@ class MattermostSender:
         self._defaultEmoji = defaultEmoji
         self.channel = channel
         self._proxy = self._getFinalProxy(proxy)
-        self._connection:Optional[HTTPConnection] = None
-        self._lock = Lock()
 
 
     def _getFinalProxy(self, configProxy:Optional[str]) -> Optional[str]:
@@ -96,6 +117,112 @@ class MattermostSender:
         return envProxy
 
 
+    @property
+    def timeout(self):
+        """Timeout for http calls"""
+        return self._timeout
+
+
+    @property
+    def defaultEmoji(self) -> Optional[str]:
+        """Mattermost emoji used for messages without emoji"""
+        return self._defaultEmoji
+
+
+    def _makeHttpBody(self, msg:str, emoji:Optional[str], channel:Optional[str]=None) -> str:
+        """Creates an http body
+
+        :param msg:     message to send to Mattermost
+        :param emoji:   Mattermost emoji for the message
+        :param channel: Mattermost channel for this message
+        :return:        body as JSON string.
+
+        If :py:obj:`emoji` evaluates to :py:const:`False` the :py:obj:`defaultEmoji`
+        passed to :py:class:`MattermostSender` will be used instead. The same
+        applies to :py:obj:`channel` and the :py:attr:`channel` attribute.
+        """
+        data = { 'text': msg }
+
+        if emoji:
+            data['icon_emoji'] = emoji
+        elif self._defaultEmoji:
+            data['icon_emoji'] = self._defaultEmoji
+
+        if channel:
+            data['channel'] = channel
+        elif self.channel:
+            data['channel'] = self.channel
+
+        return json.dumps(data)
+
+
+
+class MattermostSender(_MattermostSenderBase):
+    """Basic class to use a Mattermost webhook
+
+    This class provides methods to connect to and disconnect from Mattermost,
+    and to send messages to Mattermost.
+
+    Connecting to Mattermost can also be done in a with context:
+
+    .. code-block:: python
+
+        with MattermostSender(webhook) as sender:
+            sender.send(msg)
+            sender.send(msg2)
+
+    In that case the connection is kept until leaving the with statement and
+    all calls of :py:meth:`send` reuse it. With :py:obj:`keepAlive` set the
+    connection is kept after :py:meth:`send` even without a with statement
+    until :py:meth:`disconnect` is called.
+
+    Connections are taken from a :py:class:`ConnectionPool` shared by all
+    senders to the same destination, so several threads may call
+    :py:meth:`send` concurrently. A kept connection that was not used for
+    longer than :py:obj:`idleTimeout` is reopened before sending. If the
+    server closed a kept connection meanwhile, sending is retried once on a
+    new connection.
+
+    Requests are paced by a :py:class:`RateLimiter` shared by all senders to
+    the same host, which learns the limits from Mattermost's rate limit
+    headers. Messages rejected due to the rate limit are retried.
+    """
+
+    def __init__(self, url:str, *, timeout:Optional[float]=None, defaultEmoji:Optional[str]=None,
+                 channel:Optional[str]=None, proxy:Optional[str]=None, keepAlive:bool=False,
+                 idleTimeout:Optional[float]=defaultIdleTimeout, poolSize:int=defaultPoolSize,
+                 rateLimitRetries:int=defaultRateLimitRetries,
+                 circuitBreaker:Optional['CircuitBreaker']=None):
+        """
+        :param url: URL of a Mattermost webhook
+        :param timeout: Timeout for connecting and sending
+        :param defaultEmoji: Mattermost emoji to use if none passed to :py:meth:`send`
+        :param channel: Mattermost channel to post in. If set to :py:const:`None` (default)
+            messages appear in the webhook's configured channel. Enter channel name
+            as in the channel URL, *not* as displayed by Mattermost
+        :param proxy: Address (including port) of a proxy server for http(s) requests
+        :param keepAlive: Keep the connection open after :py:meth:`send` for
+            successive messages
+        :param idleTimeout: Seconds after which an unused connection is reopened
+            before sending. :py:const:`None` disables the check.
+        :param poolSize: Maximum number of concurrent connections. All senders
+            to the same host with the same proxy share a pool of connections,
+            which has the largest size requested by one of them.
+        :param rateLimitRetries: Number of retries of a message rejected by
+            Mattermost's rate limiter, see :py:meth:`_postMessage`
+        :param circuitBreaker: Optional :py:class:`CircuitBreaker` rejecting
+            messages without network access during outages, see :py:meth:`send`
+        """
+        super().__init__(url, timeout=timeout, defaultEmoji=defaultEmoji, channel=channel, proxy=proxy)
+        self._keepAlive = keepAlive
+        self._idleTimeout = idleTimeout
+        self._pool = getConnectionPool(self._isHttps, self._host, self._proxy, maxSize=poolSize)
+        self._isConnected = False
+        self._rateLimiter = getRateLimiter(self._host)
+        self._rateLimitRetries = rateLimitRetries
+        self._circuitBreaker = circuitBreaker
+
+
     def __enter__(self):
         """Calls :py:meth:`connect` on entering the context
 
@@ -118,20 +245,22 @@ class MattermostSender:
 
 
     @property
-    def timeout(self):
-        """Timeout for http calls"""
-        return self._timeout
+    def poolSize(self) -> int:
+        """Maximum number of connections of the shared connection pool"""
+        return self._pool.maxSize
 
 
     def isConnected(self) -> bool:
         """:return: Return :py:const:`True` if :py:obj:`self` is currently connected"""
-        return bool(self._connection)
+        return self._isConnected
 
 
     def connect(self) -> None:
         """Establish a connection to the Mattermost webhook
 
         Successive calls are ignored if :py:meth:`isConnected` returns :py:const:`True`.
+        Connections are taken from the shared :py:class:`ConnectionPool` and
+        kept there until :py:meth:`disconnect` is called.
 
         :raise MattermostError: on any error
         """
@@ -139,107 +268,177 @@ class MattermostSender:
             return
 
         try:
-            ConnectionClass = HTTPSConnection if self._isHttps else HTTPConnection
-
-            if self._proxy:
-                proxyParts = urlsplit(self._proxy)
-                assert isinstance(proxyParts.hostname, str)
-                self._connection = ConnectionClass(proxyParts.hostname, port=proxyParts.port, timeout=self.timeout)
-                assert isinstance(self._connection , HTTPConnection)
-                self._connection.set_tunnel(self._host)
-            else:
-                self._connection = ConnectionClass(self._host, timeout=self.timeout)
+            # Check that a connection can be created
+            self._pool.release(self._acquireConnection())
         except Exception as ex:
-            self._connection = None
             raise MattermostError(str(ex)) from ex
+        self._isConnected = True
 
 
     def disconnect(self) -> None:
         """Disconnect from Mattermost webhook
 
-        Successive calls are ignored if :py:meth:`isConnected` returns :py:const:`False`.
+        Successive calls are ignored if :py:meth:`isConnected` returns :py:const:`False`
+        unless :py:obj:`keepAlive` was set. Closes all idle connections of the
+        shared :py:class:`ConnectionPool`.
 
         :raise MattermostError: on any error
         """
-        if not self.isConnected():
+        if not self.isConnected() and not self._keepAlive:
             return
-        assert isinstance(self._connection, HTTPConnection)
 
         try:
-            self._connection.close()
+            self._pool.closeIdle()
         except Exception as ex:
             raise MattermostError(str(ex)) from ex
         finally:
-            self._connection = None
+            self._isConnected = False
 
 
-    def _makeHttpBody(self, msg:str, emoji:Optional[str]) -> str:
-        """Creates an http body
+    def _acquireConnection(self) -> HTTPConnection:
+        """Check out a connection from the shared :py:class:`ConnectionPool`
 
-        :param msg:   message to send to Mattermost
-        :param emoji: Mattermost emoji for the message
-        :return:      body as JSON string.
-
-        If :py:obj:`emoji` evaluates to :py:const:`False` the :py:obj:`defaultEmoji`
-        passed to :py:class:`MattermostSender` will be used instead.
+        Applies :py:attr:`timeout` and the idle timeout.
         """
-        data = { 'text': msg }
+        return self._pool.acquire(self.timeout, self._idleTimeout)
 
-        if emoji:
-            data['icon_emoji'] = emoji
-        elif self._defaultEmoji:
-            data['icon_emoji'] = self._defaultEmoji
 
-        if self.channel:
-            data['channel'] = self.channel
+    def _sendMessage(self, msg:str, emoji:Optional[str], channel:Optional[str]=None) -> None:
+        """Post message on a connection of the connected :py:obj:`self`
 
-        return json.dumps(data)
+        :param msg:     passed to :py:meth:`_postMessage`
+        :param emoji:   passed to :py:meth:`_postMessage`
+        :param channel: passed to :py:meth:`_postMessage`
+        :raise MattermostError: if the returned http status is not OK
+
+        :py:obj:`self` has to be connected, otherwise an assertion fails.
+        """
+        assert self.isConnected()
+        self._postMessage(msg, emoji, channel, keepConnection=True)
 
 
-    def _sendMessage(self, msg:str, emoji:Optional[str]) -> None:
-        """Post message to the current connection
+    def _postMessage(self, msg:str, emoji:Optional[str], channel:Optional[str]=None, *,
+                     keepConnection:bool) -> None:
+        """Post message on a connection checked out from the pool
 
-        :param msg:   passed to :py:meth:`_makeHttpBody`
-        :param emoji: passed to :py:meth:`_makeHttpBody`
+        :param msg:            passed to :py:meth:`_makeHttpBody`
+        :param emoji:          passed to :py:meth:`_makeHttpBody`
+        :param channel:        passed to :py:meth:`_makeHttpBody`
+        :param keepConnection: passed to :py:meth:`_postOnConnection`
         :raise MattermostError: if the returned http status is not OK
 
-        :py:obj:`self` has to be connected, otherwise an assertion fails.
+        Calls :py:meth:`_makeHttpBody` to create the http request body and
+        :py:meth:`_postOnConnection` to post it. Before posting, waits as long
+        as the shared :py:class:`RateLimiter` demands. If Mattermost rejects the
+        message with http status 429 (too many requests), the message is posted
+        again after the time given by the server, up to :py:obj:`rateLimitRetries`
+        times.
+        """
+        body = self._makeHttpBody(msg, emoji, channel)
+        for attempt in range(self._rateLimitRetries + 1):
+            delay = self._rateLimiter.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            response = self._postOnConnection(body, keepConnection)
+            self._rateLimiter.update(response.headers)
+            if HTTPStatus.TOO_MANY_REQUESTS != response.status:
+                break
+            self._rateLimiter.backOff(parseRetryAfter(response.getheader('Retry-After')))
+
+        if HTTPStatus.OK != response.status:
+            raise MattermostError(f"Mattermost replied with http status "
+                        f"{response.status} ({responses[response.status]})",
+                        status=response.status
+            )
+
+
+    def _postOnConnection(self, body:str, keepConnection:bool) -> HTTPResponse:
+        """Post an http body on a connection checked out from the pool
+
+        :param body:           http body created by :py:meth:`_makeHttpBody`
+        :param keepConnection: Give the connection back to the pool for reuse
+                               if :py:const:`True`, else close it
+        :return:               the completely read response
+
+        If posting on a socket kept from a previous request fails with one of
+        :py:data:`_staleConnectionErrors`, the socket is reopened and the
+        message is posted once more.
 
-        Calls :py:meth:`_makeHttpBody` to create the http request body.
+        The connection is closed instead of being reused on any exception.
         """
-        assert self.isConnected()
-        # Required to satisfy mypy type checker
-        assert self._connection is not None
+        connection = self._acquireConnection()
+        reuse = keepConnection
+        try:
+            isReused = connection.sock is not None
+            try:
+                return self._postBody(connection, body)
+            except _staleConnectionErrors:
+                if not isReused:
+                    raise
+                # Server closed the kept-alive connection meanwhile
+                connection.close()
+                return self._postBody(connection, body)
+        except BaseException:
+            reuse = False
+            raise
+        finally:
+            self._pool.release(connection, reuse=reuse)
 
+
+    def _postBody(self, connection:HTTPConnection, body:str) -> HTTPResponse:
+        """Post an http body to a connection
+
+        :param connection: connection checked out from the pool
+        :param body:       http body created by :py:meth:`_makeHttpBody`
+        :return:           the completely read response
+        """
         headers = { 'Content-Type': 'application/json' }
-        body = self._makeHttpBody(msg, emoji)
-        self._connection.request('POST', self._url, body=body, headers=headers)
+        connection.request('POST', self._url, body=body, headers=headers)
 
-        response = self._connection.getresponse()
+        response = connection.getresponse()
         # cleanup response (raises http.client.ResponseNotReady if not done)
         response.read()
-        if HTTPStatus.OK != response.status:
-            raise MattermostError(f"Mattermost replied with http status "
-                        f"{response.status} ({responses[response.status]})"
-            )
+        return response
 
 
-    def send(self, msg:str, *, emoji:Optional[str]=None) -> None:
+    def send(self, msg:str, *, emoji:Optional[str]=None, channel:Optional[str]=None) -> None:
         """Send message to Mattermost with or without existing connection
 
-        :param msg:   passed to :py:meth:`_sendMessage`
-        :param emoji: passed to :py:meth:`_sendMessage`
+        :param msg:     passed to :py:meth:`_postMessage`
+        :param emoji:   passed to :py:meth:`_postMessage`
+        :param channel: passed to :py:meth:`_postMessage` to override the
+                        channel of :py:obj:`self` for this message
         :raise MattermostError: on any error
 
-        Makes sure that :py:obj:`self` is connected and calls :py:meth:`_sendMessage`.
+        Calls :py:meth:`_postMessage` on a connection from the shared pool. An
+        idle connection is reused. The connection is closed afterwards unless
+        :py:obj:`self` is connected or :py:obj:`keepAlive` was set.
+
+        Can be called concurrently from several threads, each using its own
+        connection.
+
+        With a circuit breaker a :py:exc:`CircuitOpenError` is raised right
+        away while the breaker is open. The result of sending is reported to
+        the breaker.
         """
+        breaker = self._circuitBreaker
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError("Circuit breaker is open after repeated failures, message not sent",
+                                   retryAfter=breaker.retryAfter())
 
         try:
-            with self._lock:
-                with self:
-                    self._sendMessage(msg, emoji)
-        except MattermostError:
+            try:
+                self._postMessage(msg, emoji, channel, keepConnection=self._keepAlive or self.isConnected())
+            except MattermostError:
+                raise
+            except Exception as ex:
+                raise MattermostError(f"Sending a message raised an exception of type {type(ex)}: {ex}") from ex
+        except MattermostError as ex:
+            if breaker is not None:
+                if breaker.isOutage(ex):
+                    breaker.recordFailure()
+                else:
+                    breaker.recordSuccess()
             raise
-        except Exception as ex:
-            raise MattermostError(f"Sending a message raised an exception of type {type(ex)}: {ex}") from ex
-
+        if breaker is not None:
+            breaker.recordSuccess()
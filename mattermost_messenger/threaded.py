@@ -6,15 +6,35 @@ messages to Mattermost
 """
 
 
+import time
+import heapq
+import itertools
 import threading
 import dataclasses
 import queue
+from collections import deque
 from typing import Optional, Any
-from collections.abc import Callable
-from .sender import MattermostSender, MattermostError
+from collections.abc import Callable, Hashable
+from .sender import MattermostSender, MattermostError, CircuitOpenError, defaultIdleTimeout
+from .connection import defaultPoolSize
+from .retry import RetryPolicy
+from .breaker import CircuitBreaker, stateClosed
 
 
 
+defaultMaxMessageLength:int = 16383
+"""Default maximum length of coalesced messages, the default post size limit of Mattermost"""
+
+coalesceSeparator:str = '\n\n---\n\n'
+"""Separator between messages coalesced into one post"""
+
+_queueEmpty = object()
+"""Marker returned by :py:meth:`MattermostSenderThreaded._getAvailableItem` if the queue is empty"""
+
+_notFetched = object()
+"""Marker returned by :py:meth:`MattermostSenderThreaded._collectBatch` if no further item was fetched"""
+
+
 class MattermostSenderThreaded:
     """Variation of :py:class:`MattermostSender` using an independent thread for sending
 
@@ -23,7 +43,8 @@ class MattermostSenderThreaded:
 
     The class uses a queue of given or unlimited size to pass messages to the
     send thread. The send thread applies :py:class:`MattermostSender` to send
-    the message.
+    the message. The connection is kept alive between messages and closed when
+    the send thread terminates.
 
     In case of an error a callback function passed as :py:obj:`errorCallback`
     will be called with the data object passed to :py:meth:`send` and an error
@@ -38,6 +59,32 @@ class MattermostSenderThreaded:
         This class is not thread-safe itself. Make sure that :py:meth:`send` and
         :py:meth:`shutdown` are not called concurrently.
 
+    With :py:obj:`coalesce` set, consecutive messages in the queue with the
+    same emoji and channel are packed into one post, see :py:meth:`_collectBatch`.
+    This reduces the number of requests when many messages are queued.
+
+    With :py:obj:`workers` greater than one, several send threads drain the
+    queue in parallel. Messages with the same ordering key, by default the
+    channel, are still sent in the order of :py:meth:`send` calls: the thread
+    currently sending a message of a key also sends all further messages of
+    that key taken from the queue meanwhile by other threads.
+
+    With a :py:class:`RetryPolicy` passed as :py:obj:`retry`, messages failing
+    with a transient error are sent again after an exponentially growing delay.
+    Such messages wait in a time-ordered retry heap, so the send threads keep
+    sending fresh messages meanwhile. The error callback is only called when
+    the last attempt failed. Retried messages may overtake messages with the
+    same ordering key sent later. On :py:meth:`shutdown` waiting messages get
+    a final attempt right away.
+
+    With a :py:class:`CircuitBreaker` passed as :py:obj:`circuitBreaker`,
+    messages are not sent while the breaker is open after repeated failures.
+    Without retries they fail fast, with retries they are parked in the retry
+    heap until the breaker lets a probe pass, without using up their
+    attempts. Parked messages are sent right away when the breaker closes.
+    State changes of the breaker are reported to the error callback with
+    :py:const:`None` as data.
+
     For testing purposes :py:meth:`Queue.task_done` is called after sending
     an item from the send queue, so test code may apply :py:meth:`Queue.join` on
     the private send queue object to wait until all current items are sent.
@@ -60,11 +107,21 @@ class MattermostSenderThreaded:
         data: Optional[object] = None
         """Arbitrary object passed to error callback in case of an internal error"""
 
+        channel: Optional[str] = None
+        """Mattermost channel overriding the channel of the sender"""
+
+        attempts: int = 0
+        """Number of failed attempts to send the message"""
+
 
     def __init__(self, url:str, *, errorCallback:Callable[[object, str], None],
                  timeout:Optional[float]=None, defaultEmoji:Optional[str]=None,
                  channel:Optional[str]=None, proxy:Optional[str]=None,
-                 queueSize:Optional[int]=None, name:str='Mattermost sender'):
+                 queueSize:Optional[int]=None, name:str='Mattermost sender',
+                 idleTimeout:Optional[float]=defaultIdleTimeout, poolSize:int=defaultPoolSize,
+                 coalesce:bool=False, maxMessageLength:int=defaultMaxMessageLength,
+                 workers:int=1, orderingKey:Optional[Callable[['MattermostSenderThreaded._SendItem'], Hashable]]=None,
+                 retry:Optional[RetryPolicy]=None, circuitBreaker:Optional[CircuitBreaker]=None):
         """
         :param url:           Passed to :py:class:`MattermostSender`
         :param errorCallback: Function to notify internal errors to the caller.
@@ -79,20 +136,72 @@ class MattermostSenderThreaded:
         :param name:          Name passed as thread name to distinguish different
                               instances of this class, doesn't have to be unique.
                               Also used in error messages.
+        :param idleTimeout:   Passed to :py:class:`MattermostSender`
+        :param poolSize:      Passed to :py:class:`MattermostSender`
+        :param coalesce:      Pack queued messages into combined posts, see
+                              :py:meth:`_collectBatch`
+        :param maxMessageLength: Maximum length of a combined post
+        :param workers:       Number of send threads
+        :param orderingKey:   Function returning the key of a queue item whose
+                              messages are kept in order if :py:obj:`workers` is
+                              greater than one. Default is the channel passed to
+                              :py:meth:`send`.
+        :param retry:         Policy for sending failed messages again,
+                              :py:const:`None` disables retries
+        :param circuitBreaker: Passed to :py:class:`MattermostSender`
 
         :py:meth:`MattermostSender.timeout` multiplied by :py:attr:`_shutdownTimeoutFactor`
         will be used as :py:meth:`shutdown` timeout.
         """
+        self._threads:list[threading.Thread] = []
+        if workers < 1:
+            raise ValueError(f"Number of workers must be at least 1, got {workers}")
         self._sender = MattermostSender(url, timeout=timeout, defaultEmoji=defaultEmoji,
-                                        channel=channel, proxy=proxy)
+                                        channel=channel, proxy=proxy, keepAlive=True,
+                                        idleTimeout=idleTimeout, poolSize=poolSize,
+                                        circuitBreaker=circuitBreaker)
         self._shutdownTimeout = self._shutdownTimeoutFactor * self._sender.timeout
         if queueSize is None:
             queueSize = 0
         self._sendQueue:queue.Queue = queue.Queue(maxsize=queueSize)
         self._errorCallback = errorCallback
+        self._coalesce = coalesce
+        self._maxMessageLength = maxMessageLength
+        self._orderingKey = orderingKey if orderingKey else self._channelKey
+        self._activeKeys:dict[Hashable, deque] = {}
+        self._keyLock = threading.Lock()
+        self._retry = retry
+        self._retryHeap:list[tuple[float, int, MattermostSenderThreaded._SendItem]] = []
+        self._retryCounter = itertools.count()
+        self._retryLock = threading.Lock()
+        self._isFlushing = False
+        self._circuitBreaker = circuitBreaker
+        if circuitBreaker is not None:
+            circuitBreaker.addListener(self._reportBreakerState)
         self.name = name
-        self._thread = threading.Thread(target=self._run, name=name)
-        self._thread.start()
+        self._threads = [ threading.Thread(target=self._run, name=name if i == 0 else f"{name} #{i + 1}")
+                          for i in range(workers) ]
+        self._runningWorkers = workers
+        for thread in self._threads:
+            thread.start()
+
+
+    @property
+    def _thread(self) -> threading.Thread:
+        """First send thread"""
+        return self._threads[0]
+
+
+    @property
+    def workers(self) -> int:
+        """Number of send threads"""
+        return len(self._threads)
+
+
+    @property
+    def poolSize(self) -> int:
+        """Maximum number of connections, see :py:attr:`MattermostSender.poolSize`"""
+        return self._sender.poolSize
 
 
     def __del__(self):
@@ -100,21 +209,24 @@ class MattermostSenderThreaded:
         self.shutdown()
 
 
-    def send(self, msg:str, *, emoji:Optional[str]=None, data:Optional[object]=None) -> None:
+    def send(self, msg:str, *, emoji:Optional[str]=None, data:Optional[object]=None,
+             channel:Optional[str]=None) -> None:
         """Put a message into the send queue and return immediately
 
-        :param msg:   Message to send
-        :param emoji: Optional Mattermost emoji
-        :param data:  Optional arbitrary object, which will be passed to the error
-                      callback in case of an error. This allows the caller to relate an error
-                      callback call to the original send call.
+        :param msg:     Message to send
+        :param emoji:   Optional Mattermost emoji
+        :param data:    Optional arbitrary object, which will be passed to the error
+                        callback in case of an error. This allows the caller to relate an error
+                        callback call to the original send call.
+        :param channel: Optional Mattermost channel overriding the channel
+                        passed to :py:class:`MattermostSenderThreaded`
 
         If :py:meth:`shutdown` was called prior to this call :py:meth:`_error` is called
         instead of sending the message.
 
         If the send queue is full :py:meth:`_error` will be called instead.
         """
-        item = MattermostSenderThreaded._SendItem(msg=msg, emoji=emoji, data=data)
+        item = MattermostSenderThreaded._SendItem(msg=msg, emoji=emoji, data=data, channel=channel)
 
         if not self._thread.is_alive():
             self._error(item, f"MattermostSenderThreaded.send() called on '{self.name}' although it is shut down")
@@ -132,25 +244,31 @@ class MattermostSenderThreaded:
     def shutdown(self) -> None:
         """Signal the send thread to terminate and then wait for that
 
-        Puts a termination signal into the send queue and waits until all
-        current messages are processed and the thread terminates.
+        Puts a termination signal per send thread into the send queue and waits
+        until all current messages are processed and the threads terminate.
 
         If the send queue is full for more than a shutdown timeout (see
         :py:class:`MattermostSenderThreaded`) a log record is discarded to make
         space for the termination signal and :py:meth:`_error` is called.
         See :py:class:`MattermostSenderThreaded` for the shutdown timeout.
         """
-        while self._thread.is_alive():
+        signals = sum(thread.is_alive() for thread in self._threads)
+        while signals:
             try:
                 self._sendQueue.put(None, timeout=(self._shutdownTimeout))
-                break
+                signals -= 1
             except queue.Full:
                 self._error(None,
                             "Timeout on sending termination signal "
                             f"to MattermostSender thread '{self.name}'")
                 # Make space for next try
-                self._sendQueue.get()
-        self._thread.join()
+                if self._sendQueue.get() is None:
+                    signals += 1
+                self._sendQueue.task_done()
+        for thread in self._threads:
+            thread.join()
+        if self._circuitBreaker is not None:
+            self._circuitBreaker.removeListener(self._reportBreakerState)
 
 
     def _error(self, item:Optional[_SendItem], msg:str) -> None:
@@ -166,65 +284,323 @@ class MattermostSenderThreaded:
         self._errorCallback(data, msg)
 
 
+    def _getAvailableItem(self) -> object:
+        """Get an item from the send queue without blocking
+
+        :return: the item or :py:data:`_queueEmpty` if the queue is empty
+        """
+        try:
+            return self._sendQueue.get(block=False)
+        except queue.Empty:
+            return _queueEmpty
+
+
+    def _coalescedPart(self, item:_SendItem) -> str:
+        """:return: message of :py:obj:`item` with its emoji as marker for a combined post"""
+        emoji = item.emoji or self._sender.defaultEmoji
+        return f"{emoji} {item.msg}" if emoji else item.msg
+
+
+    def _collectBatch(self, batch:list[_SendItem]) -> object:
+        """Add available items from the queue to :py:obj:`batch` for a combined post
+
+        :param batch: list containing the first item of the batch, which is extended
+        :return:      the first item that doesn't fit into the batch, which may
+                      be a termination item, or :py:data:`_queueEmpty`. If that
+                      item was handed over by :py:meth:`_claimKey`,
+                      :py:data:`_notFetched` is returned instead.
+
+        Items are added as long as they have the same emoji, channel, and
+        ordering key as the first item, and as long as the combined message
+        with :py:data:`coalesceSeparator` between the items doesn't exceed the
+        maximum message length.
+        """
+        first = batch[0]
+        length = len(self._coalescedPart(first))
+        while True:
+            item = self._getAvailableItem()
+            if not isinstance(item, MattermostSenderThreaded._SendItem):
+                return item
+            length += len(coalesceSeparator) + len(self._coalescedPart(item))
+            if (item.emoji != first.emoji or item.channel != first.channel
+                or length > self._maxMessageLength or not self._isSameKey(item, first)):
+                return item if self._claimKey(item) else _notFetched
+            batch.append(item)
+
+
+    def _channelKey(self, item:_SendItem) -> Hashable:
+        """Default ordering key: the channel of :py:obj:`item`"""
+        return item.channel
+
+
+    def _isSameKey(self, item:_SendItem, other:_SendItem) -> bool:
+        """:return: :py:const:`True` if both items have the same ordering key or if there is only one worker"""
+        return len(self._threads) == 1 or self._orderingKey(item) == self._orderingKey(other)
+
+
+    def _claimKey(self, item:_SendItem) -> bool:
+        """Claim the ordering key of :py:obj:`item` for the current thread
+
+        :return: :py:const:`True` if the current thread has to send :py:obj:`item`.
+                 :py:const:`False` if another thread is sending an item with
+                 the same key. In that case :py:obj:`item` is handed over to
+                 that thread.
+
+        Always returns :py:const:`True` if there is only one worker.
+        """
+        if len(self._threads) == 1:
+            return True
+        key = self._orderingKey(item)
+        with self._keyLock:
+            pending = self._activeKeys.get(key)
+            if pending is not None:
+                pending.append(item)
+                return False
+            self._activeKeys[key] = deque()
+            return True
+
+
+    def _sendPending(self, item:_SendItem) -> None:
+        """Send items handed over for the ordering key of :py:obj:`item` and release that key
+
+        Does nothing if there is only one worker.
+        """
+        if len(self._threads) == 1:
+            return
+        key = self._orderingKey(item)
+        while True:
+            with self._keyLock:
+                pending = self._activeKeys[key]
+                if not pending:
+                    del self._activeKeys[key]
+                    return
+                nextItem = pending.popleft()
+            self._sendBatch([nextItem])
+
+
+    def _sendClaimed(self, item:_SendItem) -> object:
+        """Send :py:obj:`item` whose ordering key is claimed
+
+        :return: see :py:meth:`_collectBatch`, :py:data:`_notFetched` without coalescing
+
+        With coalescing the batch of :py:obj:`item` is collected first. After
+        sending the batch, items handed over meanwhile are sent and the key is
+        released.
+        """
+        batch = [item]
+        nextItem = self._collectBatch(batch) if self._coalesce else _notFetched
+        try:
+            self._sendBatch(batch)
+        finally:
+            self._sendPending(item)
+        return nextItem
+
+
+    def _sendBatch(self, batch:list[_SendItem]) -> None:
+        """Send the items of :py:obj:`batch` in one post
+
+        :param batch: items with the same emoji and channel
+
+        A single item is sent as is, several items are combined with
+        :py:data:`coalesceSeparator` and their emojis as markers. In case of a
+        :py:exc:`MattermostError` each item is scheduled for a retry by
+        :py:meth:`_scheduleRetry` or, if that isn't possible, :py:meth:`_error`
+        is called for it. :py:meth:`Queue.task_done` is called for each item
+        that isn't scheduled for a retry.
+        """
+        first = batch[0]
+        done = batch
+        try:
+            if len(batch) == 1:
+                msg = first.msg
+            else:
+                msg = coalesceSeparator.join(self._coalescedPart(item) for item in batch)
+            self._sender.send(msg, emoji=first.emoji, channel=first.channel)
+        except MattermostError as ex:
+            done = []
+            for item in batch:
+                if not self._scheduleRetry(item, ex):
+                    self._reportSendError(item, ex)
+                    done.append(item)
+        finally:
+            for _ in done:
+                self._sendQueue.task_done()
+
+
+    def _scheduleRetry(self, item:_SendItem, ex:MattermostError) -> bool:
+        """Put :py:obj:`item` into the retry heap if the retry policy allows another attempt
+
+        :param item: item that failed to be sent
+        :param ex:   the error raised on sending
+        :return:     :py:const:`True` if the item was scheduled
+
+        No retries are scheduled while :py:meth:`_flushRetries` runs. Items
+        rejected by an open circuit breaker are parked until the breaker lets
+        a probe pass and don't count as failed attempt.
+        """
+        if not isinstance(ex, CircuitOpenError):
+            item.attempts += 1
+        if self._retry is None or self._isFlushing:
+            return False
+        if isinstance(ex, CircuitOpenError):
+            delay = ex.retryAfter
+        elif item.attempts < self._retry.maxAttempts and self._retry.isRetryable(ex):
+            delay = self._retry.delay(item.attempts)
+        else:
+            return False
+        due = time.monotonic() + delay
+        with self._retryLock:
+            heapq.heappush(self._retryHeap, (due, next(self._retryCounter), item))
+        return True
+
+
+    def _releaseRetries(self) -> None:
+        """Make all items in the retry heap due now, keeping their order"""
+        now = time.monotonic()
+        with self._retryLock:
+            self._retryHeap = [ (min(due, now), counter, item) for due, counter, item in self._retryHeap ]
+            heapq.heapify(self._retryHeap)
+
+
+    def _reportBreakerState(self, oldState:str, newState:str) -> None:
+        """Listener of the circuit breaker reporting state changes with :py:meth:`_error`
+
+        Parked items are released by :py:meth:`_releaseRetries` when the breaker closes.
+        """
+        if newState == stateClosed:
+            self._releaseRetries()
+        self._error(None, f"Circuit breaker of '{self.name}' changed from {oldState} to {newState}")
+
+
+    def _nextRetryDelay(self) -> Optional[float]:
+        """:return: seconds until the next retry is due or :py:const:`None` if no retry is waiting"""
+        with self._retryLock:
+            if not self._retryHeap:
+                return None
+            return max(0.0, self._retryHeap[0][0] - time.monotonic())
+
+
+    def _popRetry(self, dueOnly:bool=True) -> Optional[_SendItem]:
+        """Take the first item from the retry heap
+
+        :param dueOnly: only take the item if its retry is due
+        :return:        the item or :py:const:`None` if there is none (due)
+        """
+        with self._retryLock:
+            if not self._retryHeap or (dueOnly and self._retryHeap[0][0] > time.monotonic()):
+                return None
+            return heapq.heappop(self._retryHeap)[2]
+
+
+    def _sendRetries(self, dueOnly:bool=True) -> None:
+        """Send items from the retry heap one by one
+
+        :param dueOnly: only send items whose retry is due
+        """
+        if not self._retryHeap:
+            return
+        while item := self._popRetry(dueOnly):
+            if self._claimKey(item):
+                try:
+                    self._sendBatch([item])
+                finally:
+                    self._sendPending(item)
+
+
+    def _flushRetries(self) -> None:
+        """Give all items in the retry heap a final attempt without waiting for their retry time"""
+        self._isFlushing = True
+        self._sendRetries(dueOnly=False)
+
+
+    def _reportSendError(self, item:_SendItem, ex:MattermostError) -> None:
+        """Call :py:meth:`_error` with a message describing why :py:obj:`item` couldn't be sent"""
+        channel = item.channel or self._sender.channel
+        emojiMsg = f" with emoji '{item.emoji}'" if item.emoji else ""
+        channelMsg = f" to channel '{channel}'" if channel else ""
+        dataMsg = f" with message data: {item.data}" if item.data else ""
+        errMsg = f"Error in '{self.name}' sending message \"{item.msg}\"{emojiMsg}{channelMsg}: \"{ex}\"{dataMsg}"
+        self._error(item, errMsg)
+
+
     def _sendAvailabelItems(self, firstItem:Optional[_SendItem]) -> None:
         """Send :py:obj:`firstItem` and all currently in the queue available items
 
         :param firstItem: first item to send if not :py:const:`None`
 
-        Calls :py:meth:`MattermostSender.send` on :py:obj:`firstItem` and each
-        successive item in the queue. In case that this raises a
-        :py:exc:`MattermostError` :py:meth:`_error` will be called and the next
-        item will be sent.
+        Calls :py:meth:`_sendClaimed` on :py:obj:`firstItem` and each successive
+        item in the queue, unless :py:meth:`_claimKey` hands the item over to
+        another thread. With coalescing enabled, each batch is extended by
+        :py:meth:`_collectBatch` before sending. Errors are reported per item
+        by :py:meth:`_sendBatch`, then the next item will be sent. Retries
+        becoming due meanwhile are sent in between.
 
         If the queue is empty the method returns. If a termination item (item that
         evaluates to :py:const:`False`) is found in the queue (including
         :py:obj:`firstItem`) it is put back and the method returns. That ensures
         that the thread function :py:meth:`_run` will receive it.
         """
-        item = firstItem
+        item:object = firstItem
+        isClaimed = False
         while item:
             assert isinstance(item, MattermostSenderThreaded._SendItem)
-            try:
-                self._sender.send(item.msg, emoji=item.emoji)
-            except MattermostError as ex:
-                emojiMsg = f" with emoji '{item.emoji}'" if item.emoji else ""
-                channelMsg = f" to channel '{self._sender.channel}'" if self._sender.channel else ""
-                dataMsg = f" with message data: {item.data}" if item.data else ""
-                errMsg = f"Error in '{self.name}' sending message \"{item.msg}\"{emojiMsg}{channelMsg}: \"{ex}\"{dataMsg}"
-                self._error(item, errMsg)
-            finally:
-                self._sendQueue.task_done()
-
-            try:
-                item = self._sendQueue.get(block=False)
-            except queue.Empty:
+            if isClaimed or self._claimKey(item):
+                item = self._sendClaimed(item)
+            else:
+                item = _notFetched
+            # Items returned by _collectBatch are already claimed
+            isClaimed = isinstance(item, MattermostSenderThreaded._SendItem)
+
+            if item is _notFetched:
+                self._sendRetries()
+                item = self._getAvailableItem()
+            if item is _queueEmpty:
                 return
 
         self._sendQueue.put(None)
 
 
+    def _getItem(self) -> object:
+        """Get the next item from the send queue, sending due retries while waiting
+
+        :return: the item, which may be a termination item
+        """
+        while True:
+            self._sendRetries()
+            try:
+                return self._sendQueue.get(timeout=self._nextRetryDelay())
+            except queue.Empty:
+                pass
+
+
     def _run(self) -> None:
         """Thread function getting items from the queue and sending them to Mattermost
 
-        If an item is available a connection to Mattermost is established and
-        :py:meth:`_sendAvailabelItems` is called to send all items at once before
-        disconnecting from Mattermost until the next item is available.
-
-        Calls :py:meth:`_error` if a :py:exc:`MattermostError` is catched due to
-        connection problems. After that it tries again with the next item.
+        If an item is available :py:meth:`_sendAvailabelItems` is called to send
+        all items at once. The connection to Mattermost is kept alive for the
+        next items and closed before the method returns.
 
         When a termination item (item that evaluates to :py:const:`False`) is
-        found in the queue the method returns after calling :py:meth:`Queue.task_done`
-        as often as possible. Note, that :py:meth:`_sendAvailabelItems` puts a
+        found in the queue the method returns. The last terminating send thread
+        gives waiting retries a final attempt, closes the connections and calls :py:meth:`Queue.task_done` as often as
+        possible before. Note, that :py:meth:`_sendAvailabelItems` puts a
         termination item back into the queue so that this method would receive it.
         """
 
-        while item := self._sendQueue.get():
-            try:
-                with self._sender:
-                    self._sendAvailabelItems(item)
-            except MattermostError as ex:
-                self._error(item, f"Error connecting to Mattermost in '{self.name}': {ex}")
+        while item := self._getItem():
+            self._sendAvailabelItems(item)
+
+        with self._keyLock:
+            self._runningWorkers -= 1
+            if self._runningWorkers > 0:
+                return
+
+        self._flushRetries()
+
+        try:
+            self._sender.disconnect()
+        except MattermostError as ex:
+            self._error(None, f"Error disconnecting from Mattermost in '{self.name}': {ex}")
 
         # Call self._sendQueue.task_done() for final None items
         try:
@@ -0,0 +1,96 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Unit tests for AsyncMattermostHandler
+"""
+
+
+
+import asyncio
+import logging
+import threading
+import unittest
+import contextlib
+from io import StringIO
+from mattermost_messenger import AsyncMattermostHandler
+from .webhookServer import WebhookServer
+
+
+emojis = {
+    logging.NOTSET: 'notset',
+    logging.ERROR: 'error',
+}
+
+
+
+class TestAsyncMattermostHandler(unittest.IsolatedAsyncioTestCase):
+    """Tests for class AsyncMattermostHandler with a local webhook server"""
+
+    def setUp(self):
+        """Start a local webhook server and create the handler"""
+        self.server = WebhookServer()
+        self.server.__enter__()
+        self.handler = AsyncMattermostHandler(self.server.url, emojis=emojis)
+
+    def tearDown(self):
+        """Stop the local webhook server"""
+        self.server.__exit__(None, None, None)
+
+    def makeRecord(self, msg, level=logging.ERROR):
+        """Helper creating a logging.LogRecord object"""
+        return logging.LogRecord(name='NoLogger', level=level, pathname=__file__, lineno=0,
+                                 msg=msg, args=(), exc_info=None)
+
+    def testEmitWithoutLoop(self):
+        """Test emit outside of a running event loop"""
+        with contextlib.redirect_stderr(StringIO()) as outputBuf:
+            self.handler.emit(self.makeRecord("no loop"))
+        self.assertRegex(outputBuf.getvalue(), "before an event loop was running.+no loop")
+
+    async def testEmit(self):
+        """Test emit and aclose"""
+        self.handler.emit(self.makeRecord("error message"))
+        self.handler.emit(self.makeRecord("info message", logging.INFO))
+        await self.handler.aclose()
+        self.assertEqual(sorted(self.server.posts, key=lambda p: p['text']), [
+            { 'text': "error message", 'icon_emoji': 'error' },
+            { 'text': "info message", 'icon_emoji': 'notset' },
+        ])
+
+    async def testEmitFromThread(self):
+        """Test emit from another thread"""
+        self.handler.emit(self.makeRecord("message 1"))
+        thread = threading.Thread(target=self.handler.emit, args=(self.makeRecord("message 2"),))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        await self.handler.aclose()
+        self.assertEqual(len(self.server.posts), 2)
+
+    async def testError(self):
+        """Test error reporting"""
+        self.server.status = 500
+        with contextlib.redirect_stderr(StringIO()) as outputBuf:
+            self.handler.emit(self.makeRecord("failing message"))
+            await self.handler.aclose()
+        self.assertRegex(outputBuf.getvalue(), "500.+failing message")
+
+    async def testQueueSize(self):
+        """Test full queue"""
+        handler = AsyncMattermostHandler(self.server.url, queueSize=1)
+        with contextlib.redirect_stderr(StringIO()) as outputBuf:
+            handler.emit(self.makeRecord("message 1"))
+            handler.emit(self.makeRecord("message 2"))
+            await handler.aclose()
+        self.assertRegex(outputBuf.getvalue(), "queue of 'AsyncMattermostHandler' full")
+        self.assertEqual(len(self.server.posts), 1)
+
+    async def testClose(self):
+        """Test close and emit after that"""
+        self.handler.emit(self.makeRecord("message"))
+        self.handler.close()
+        await self.handler._consumer
+        with contextlib.redirect_stderr(StringIO()) as outputBuf:
+            self.handler.emit(self.makeRecord("late message"))
+        self.assertRegex(outputBuf.getvalue(), "although it is closed")
+        self.assertEqual(len(self.server.posts), 1)
@@ -0,0 +1,95 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Unit tests for AsyncMattermostSender
+"""
+
+
+
+import asyncio
+import unittest
+from mattermost_messenger import AsyncMattermostSender, MattermostError
+from .webhookServer import WebhookServer, TunnelProxy
+
+
+
+class TestAsyncMattermostSender(unittest.IsolatedAsyncioTestCase):
+    """Tests for class AsyncMattermostSender with a local webhook server"""
+
+    def setUp(self):
+        """Start a local webhook server"""
+        self.server = WebhookServer()
+        self.server.__enter__()
+
+    def tearDown(self):
+        """Stop the local webhook server"""
+        self.server.__exit__(None, None, None)
+
+    def testInit(self):
+        """Test __init__ results"""
+        sender = AsyncMattermostSender('https://example.com:8443/hooks/broken?x=1', timeout=12,
+                                       channel='channel', concurrency=2)
+        self.assertEqual(sender._hostname, 'example.com')
+        self.assertEqual(sender._port, 8443)
+        self.assertEqual(sender._path, '/hooks/broken?x=1')
+        self.assertEqual(sender.timeout, 12)
+        self.assertEqual(sender.channel, 'channel')
+        self.assertEqual(sender.concurrency, 2)
+        with self.assertRaises(ValueError):
+            AsyncMattermostSender('https://example.com/hooks/broken', concurrency=0)
+
+    async def testSend(self):
+        """Test send method reusing one connection"""
+        async with AsyncMattermostSender(self.server.url, channel='channel') as sender:
+            await sender.send("message 1", emoji=':emoji:')
+            await sender.send("message 2")
+        self.assertEqual(self.server.posts, [
+            { 'text': "message 1", 'icon_emoji': ':emoji:', 'channel': 'channel' },
+            { 'text': "message 2", 'channel': 'channel' },
+        ])
+        self.assertEqual(self.server.connections, 1)
+
+    async def testConcurrency(self):
+        """Test concurrent sends"""
+        async with AsyncMattermostSender(self.server.url, concurrency=2) as sender:
+            await asyncio.gather(*[ sender.send(f"message {i}") for i in range(6) ])
+        self.assertEqual(len(self.server.posts), 6)
+        self.assertLessEqual(self.server.connections, 2)
+
+    async def testStaleConnection(self):
+        """Test reconnect after the server closed a kept connection"""
+        async with AsyncMattermostSender(self.server.url) as sender:
+            await sender.send("message 1")
+            self.server.closeConnections()
+            await asyncio.sleep(0.05)
+            await sender.send("message 2")
+        self.assertEqual(len(self.server.posts), 2)
+
+    async def testErrorStatus(self):
+        """Test error on non-OK http status"""
+        self.server.status = 404
+        async with AsyncMattermostSender(self.server.url) as sender:
+            with self.assertRaisesRegex(MattermostError, "404"):
+                await sender.send("message")
+
+    async def testConnectionError(self):
+        """Test error if no server is available"""
+        async with AsyncMattermostSender('http://127.0.0.1:1/hooks/none') as sender:
+            with self.assertRaises(MattermostError):
+                await sender.send("message")
+
+    async def testProxy(self):
+        """Test sending through a CONNECT tunnel"""
+        with TunnelProxy() as proxy:
+            async with AsyncMattermostSender(self.server.url, proxy=proxy.url) as sender:
+                await sender.send("message 1")
+                await sender.send("message 2")
+            self.assertEqual(proxy.tunnels, 1)
+        self.assertEqual(len(self.server.posts), 2)
+
+    async def testRateLimit(self):
+        """Test retry of messages rejected with http status 429"""
+        self.server.replies = [(429, { 'Retry-After': '0' })]
+        async with AsyncMattermostSender(self.server.url) as sender:
+            await sender.send("message")
+        self.assertEqual(len(self.server.posts), 2)
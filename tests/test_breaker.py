@@ -0,0 +1,80 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Unit tests for CircuitBreaker
+"""
+
+
+
+import time
+import unittest
+from mattermost_messenger import CircuitBreaker, CircuitOpenError, MattermostError
+
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests for class CircuitBreaker"""
+
+    def setUp(self):
+        """Create a CircuitBreaker object recording its state changes"""
+        self.changes = []
+        self.breaker = CircuitBreaker(failureThreshold=3, probeInterval=0.1)
+        self.breaker.addListener(lambda old, new: self.changes.append((old, new)))
+
+    def testInit(self):
+        """Test initial state"""
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.breaker.failureThreshold, 3)
+        self.assertEqual(self.breaker.probeInterval, 0.1)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.retryAfter(), 0)
+        with self.assertRaises(ValueError):
+            CircuitBreaker(failureThreshold=0)
+
+    def testOpen(self):
+        """Test opening after successive failures only"""
+        self.breaker.recordFailure()
+        self.breaker.recordFailure()
+        self.breaker.recordSuccess()
+        self.breaker.recordFailure()
+        self.breaker.recordFailure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.recordFailure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allow())
+        self.assertGreater(self.breaker.retryAfter(), 0)
+        self.assertEqual(self.changes, [('closed', 'open')])
+
+    def testProbe(self):
+        """Test half-open state with a single probe request"""
+        for _ in range(3):
+            self.breaker.recordFailure()
+        time.sleep(0.1)
+        self.assertEqual(self.breaker.retryAfter(), 0)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertFalse(self.breaker.allow())
+        self.assertGreater(self.breaker.retryAfter(), 0)
+        self.breaker.recordFailure()
+        self.assertEqual(self.breaker.state, 'open')
+        time.sleep(0.1)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.recordSuccess()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertEqual(self.changes, [('closed', 'open'), ('open', 'half-open'), ('half-open', 'open'),
+                                        ('open', 'half-open'), ('half-open', 'closed')])
+
+    def testIsOutage(self):
+        """Test classification of errors"""
+        self.assertTrue(CircuitBreaker.isOutage(MattermostError("refused")))
+        self.assertTrue(CircuitBreaker.isOutage(MattermostError("bad gateway", status=502)))
+        self.assertFalse(CircuitBreaker.isOutage(MattermostError("bad request", status=400)))
+        self.assertFalse(CircuitBreaker.isOutage(CircuitOpenError("open", retryAfter=1)))
+
+    def testRemoveListener(self):
+        """Test removing a listener"""
+        self.breaker.removeListener(self.breaker._listeners[0])
+        self.breaker.removeListener(print)
+        for _ in range(3):
+            self.breaker.recordFailure()
+        self.assertEqual(self.changes, [])
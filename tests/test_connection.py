@@ -0,0 +1,82 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Unit tests for ConnectionPool
+"""
+
+
+
+import unittest
+from mattermost_messenger.connection import ConnectionPool, ConnectionPoolTimeout, getConnectionPool
+from .webhookServer import WebhookServer
+
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Tests for class ConnectionPool"""
+
+    def setUp(self):
+        """Create a ConnectionPool object for testing"""
+        self.pool = ConnectionPool(False, 'example.com', None, maxSize=2)
+
+    def testInit(self):
+        """Test __init__ results"""
+        self.assertEqual(self.pool.key, ('http', 'example.com', None))
+        self.assertEqual(self.pool.maxSize, 2)
+        with self.assertRaises(ValueError):
+            ConnectionPool(False, 'example.com', None, maxSize=0)
+
+    def testProxy(self):
+        """Test connections through a proxy"""
+        pool = ConnectionPool(True, 'example.com', 'http://proxy.example.com:3128')
+        connection = pool.acquire(1)
+        self.assertEqual(connection.host, 'proxy.example.com')
+        self.assertEqual(connection.port, 3128)
+        self.assertEqual(connection._tunnel_host, 'example.com')
+
+    def testAcquireRelease(self):
+        """Test acquire and release methods"""
+        connection = self.pool.acquire(1)
+        self.pool.release(connection)
+        self.assertIs(self.pool.acquire(1), connection)
+        connection2 = self.pool.acquire(1)
+        self.assertIsNot(connection2, connection)
+        with self.assertRaises(ConnectionPoolTimeout):
+            self.pool.acquire(0.05)
+
+        self.pool.release(connection, reuse=False)
+        self.assertIsNot(self.pool.acquire(1), connection)
+
+    def testIdleTimeout(self):
+        """Test dropping of idle connections"""
+        connection = self.pool.acquire(1)
+        self.pool.release(connection)
+        self.assertIsNot(self.pool.acquire(1, idleTimeout=-1), connection)
+
+    def testCloseIdle(self):
+        """Test closeIdle method"""
+        connection = self.pool.acquire(1)
+        self.pool.release(connection)
+        self.pool.closeIdle()
+        self.assertIsNot(self.pool.acquire(1), connection)
+
+    def testHealthCheck(self):
+        """Test that connections closed by the server are dropped"""
+        with WebhookServer() as server:
+            pool = getConnectionPool(False, server.url.split('/')[2], None)
+            connection = pool.acquire(1)
+            connection.request('POST', server.url, body=b'{}')
+            connection.getresponse().read()
+            pool.release(connection)
+            self.assertIs(pool.acquire(1), connection)
+            pool.release(connection)
+
+            server.closeConnections()
+            self.assertIsNot(pool.acquire(1), connection)
+
+    def testGetConnectionPool(self):
+        """Test getConnectionPool function"""
+        pool = getConnectionPool(True, 'pool.example.com', None, maxSize=2)
+        self.assertIs(getConnectionPool(True, 'pool.example.com', None), pool)
+        self.assertEqual(pool.maxSize, 4)
+        self.assertIsNot(getConnectionPool(False, 'pool.example.com', None), pool)
@@ -204,3 +204,10 @@ class TestMattermostHandler(unittest.TestCase):
         check(logging.CRITICAL + 1, 'critical')
 
 
+
+
+    def testPoolSize(self):
+        """Test poolSize argument"""
+        handler = MattermostHandler(webhookUrl, poolSize=6)
+        self.assertEqual(handler.poolSize, 6)
+        handler.close()
@@ -0,0 +1,64 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Unit tests for RateLimiter
+"""
+
+
+
+import time
+import unittest
+from email.utils import formatdate
+from mattermost_messenger.ratelimit import RateLimiter, parseRetryAfter, getRateLimiter
+
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Tests for class RateLimiter"""
+
+    def setUp(self):
+        """Create a RateLimiter object for testing"""
+        self.limiter = RateLimiter()
+
+    def testParseRetryAfter(self):
+        """Test parseRetryAfter function"""
+        self.assertEqual(parseRetryAfter('3'), 3)
+        self.assertEqual(parseRetryAfter('-3'), 0)
+        self.assertIsNone(parseRetryAfter(None))
+        self.assertIsNone(parseRetryAfter('soon'))
+        self.assertAlmostEqual(parseRetryAfter(formatdate(time.time() + 60, usegmt=True)), 60, delta=2)
+
+    def testUnknownRate(self):
+        """Test that requests are not paced before a limit is known"""
+        self.assertIsNone(self.limiter.rate)
+        for _ in range(100):
+            self.assertEqual(self.limiter.reserve(), 0)
+
+    def testUpdate(self):
+        """Test learning from rate limit headers"""
+        self.limiter.update({ 'X-Ratelimit-Limit': '10', 'X-Ratelimit-Remaining': '2', 'X-Ratelimit-Reset': '1' })
+        self.assertEqual(self.limiter.rate, 10)
+        self.assertEqual(self.limiter.reserve(), 0)
+        self.assertEqual(self.limiter.reserve(), 0)
+        self.assertAlmostEqual(self.limiter.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(self.limiter.reserve(), 0.2, delta=0.01)
+
+        self.limiter.update({ 'X-Ratelimit-Limit': 'x' })
+        self.assertEqual(self.limiter.rate, 10)
+
+    def testExhausted(self):
+        """Test no remaining requests"""
+        self.limiter.update({ 'x-ratelimit-limit': '10', 'x-ratelimit-remaining': '0', 'x-ratelimit-reset': '2' })
+        self.assertAlmostEqual(self.limiter.reserve(), 2, delta=0.05)
+
+    def testBackOff(self):
+        """Test backOff method"""
+        self.assertEqual(self.limiter.backOff(0.5), 0.5)
+        self.assertAlmostEqual(self.limiter.reserve(), 0.5, delta=0.05)
+        self.assertEqual(self.limiter.backOff(None), 1)
+
+    def testGetRateLimiter(self):
+        """Test getRateLimiter function"""
+        limiter = getRateLimiter('limit.example.com')
+        self.assertIs(getRateLimiter('limit.example.com'), limiter)
+        self.assertIsNot(getRateLimiter('other.example.com'), limiter)
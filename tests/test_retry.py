@@ -0,0 +1,50 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Unit tests for RetryPolicy
+"""
+
+
+
+import unittest
+from http.client import RemoteDisconnected
+from mattermost_messenger import RetryPolicy, MattermostError
+
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Tests for class RetryPolicy"""
+
+    def testIsRetryable(self):
+        """Test classification of errors"""
+        policy = RetryPolicy()
+        self.assertTrue(policy.isRetryable(MattermostError("bad gateway", status=502)))
+        self.assertTrue(policy.isRetryable(MattermostError("too many requests", status=429)))
+        self.assertFalse(policy.isRetryable(MattermostError("bad request", status=400)))
+        for cause in (ConnectionRefusedError(), TimeoutError(), RemoteDisconnected()):
+            try:
+                raise MattermostError(str(cause)) from cause
+            except MattermostError as ex:
+                self.assertTrue(policy.isRetryable(ex))
+        try:
+            raise MattermostError("invalid") from ValueError()
+        except MattermostError as ex:
+            self.assertFalse(policy.isRetryable(ex))
+        self.assertFalse(policy.isRetryable(MattermostError("no cause")))
+        self.assertTrue(RetryPolicy(retryableStatuses=frozenset({400})).isRetryable(
+            MattermostError("bad request", status=400)))
+
+    def testDelay(self):
+        """Test exponential backoff with jitter"""
+        policy = RetryPolicy(baseDelay=1, maxDelay=5, jitter=0)
+        self.assertEqual([ policy.delay(attempt) for attempt in range(1, 6) ], [1, 2, 4, 5, 5])
+        policy = RetryPolicy(baseDelay=2, jitter=0.5)
+        for _ in range(100):
+            self.assertTrue(1 <= policy.delay(1) <= 2)
+
+    def testInvalid(self):
+        """Test validation of arguments"""
+        with self.assertRaises(ValueError):
+            RetryPolicy(maxAttempts=0)
+        with self.assertRaises(ValueError):
+            RetryPolicy(jitter=2)
@@ -8,9 +8,12 @@ Unit tests for MattermostSender
 
 import os
 import unittest
+import threading
+import time
 import json
 
-from mattermost_messenger import MattermostSender, MattermostError
+from mattermost_messenger import MattermostSender, MattermostError, CircuitBreaker, CircuitOpenError
+from .webhookServer import WebhookServer
 
 
 webhookUrl = 'https://example.com/hooks/broken'
@@ -92,6 +95,15 @@ class TestMattermostSender(unittest.TestCase):
         }
         self.assertDictEqual(content, expected)
 
+    def testHttpBodyChannel(self):
+        """Test _makeHttpBody method with channel argument"""
+        body = self.sender._makeHttpBody("my message", None, 'other')
+        self.assertDictEqual(json.loads(body), { 'text': "my message", 'channel': 'other' })
+
+        senderWithoutChannel = MattermostSender(webhookUrl)
+        body = senderWithoutChannel._makeHttpBody("my message", None, 'other')
+        self.assertDictEqual(json.loads(body), { 'text': "my message", 'channel': 'other' })
+
     def testConnect(self):
         """Test connect and disconnect methods"""
         self.sender.disconnect()
@@ -125,3 +137,129 @@ class TestMattermostSender(unittest.TestCase):
                 self.sender.send("my message", emoji=':emoji:')
 
 
+
+
+
+class TestMattermostSenderKeepAlive(unittest.TestCase):
+    """Tests for connection reuse of MattermostSender with a local webhook server"""
+
+    def setUp(self):
+        """Start a local webhook server"""
+        self.server = WebhookServer()
+        self.server.__enter__()
+
+    def tearDown(self):
+        """Stop the local webhook server"""
+        self.server.__exit__(None, None, None)
+
+    def testReuseInContext(self):
+        """Test that send reuses the connection of an outer with statement"""
+        sender = MattermostSender(self.server.url)
+        with sender:
+            sender.send("message 1")
+            sender.send("message 2")
+            self.assertTrue(sender.isConnected())
+        self.assertFalse(sender.isConnected())
+        self.assertEqual([ p['text'] for p in self.server.posts ], ["message 1", "message 2"])
+        self.assertEqual(self.server.connections, 1)
+
+    def testNoKeepAlive(self):
+        """Test that send without context closes its connection"""
+        sender = MattermostSender(self.server.url)
+        sender.send("message 1")
+        self.assertFalse(sender.isConnected())
+        sender.send("message 2")
+        self.assertEqual(self.server.connections, 2)
+
+    def testKeepAlive(self):
+        """Test keepAlive argument"""
+        sender = MattermostSender(self.server.url, keepAlive=True)
+        sender.send("message 1")
+        sender.send("message 2")
+        self.assertEqual(self.server.connections, 1)
+
+    def testStaleConnection(self):
+        """Test reconnect after the server closed a kept connection"""
+        sender = MattermostSender(self.server.url, keepAlive=True)
+        sender.send("message 1")
+        self.server.closeConnections()
+        sender.send("message 2")
+        sender.disconnect()
+        self.assertEqual(len(self.server.posts), 2)
+        self.assertEqual(self.server.connections, 2)
+
+    def testIdleTimeout(self):
+        """Test reconnect after idleTimeout elapsed"""
+        sender = MattermostSender(self.server.url, keepAlive=True, idleTimeout=0)
+        sender.send("message 1")
+        sender.send("message 2")
+        sender.disconnect()
+        self.assertEqual(len(self.server.posts), 2)
+        self.assertEqual(self.server.connections, 2)
+
+    def testErrorStatus(self):
+        """Test error on non-OK http status"""
+        self.server.status = 404
+        sender = MattermostSender(self.server.url)
+        with self.assertRaisesRegex(MattermostError, "404"):
+            sender.send("message")
+
+    def testConcurrentSend(self):
+        """Test that concurrent sends use separate connections of the pool"""
+        sender = MattermostSender(self.server.url, keepAlive=True, poolSize=3)
+        self.assertEqual(sender.poolSize, 3)
+        threads = [ threading.Thread(target=sender.send, args=(f"message {i}",)) for i in range(6) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.server.posts), 6)
+        self.assertLessEqual(self.server.connections, 3)
+
+    def testSharedPool(self):
+        """Test that senders to the same destination share their pool"""
+        sender = MattermostSender(self.server.url, keepAlive=True)
+        sender2 = MattermostSender(self.server.url, keepAlive=True, poolSize=8)
+        self.assertIs(sender._pool, sender2._pool)
+        self.assertEqual(sender.poolSize, 8)
+        sender.send("message 1")
+        sender2.send("message 2")
+        self.assertEqual(self.server.connections, 1)
+
+    def testRateLimit(self):
+        """Test retry of messages rejected with http status 429"""
+        self.server.replies = [(429, { 'Retry-After': '0.1' }),
+                               (200, { 'X-Ratelimit-Limit': '100', 'X-Ratelimit-Remaining': '50' })]
+        sender = MattermostSender(self.server.url)
+        start = time.monotonic()
+        sender.send("message")
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertEqual(len(self.server.posts), 2)
+        self.assertEqual(sender._rateLimiter.rate, 100)
+
+    def testRateLimitExhausted(self):
+        """Test error if retries of rate limited messages are exhausted"""
+        self.server.replies = [(429, { 'Retry-After': '0' })] * 3
+        sender = MattermostSender(self.server.url, rateLimitRetries=2)
+        with self.assertRaisesRegex(MattermostError, "429") as context:
+            sender.send("message")
+        self.assertEqual(context.exception.status, 429)
+        self.assertEqual(len(self.server.posts), 3)
+
+    def testCircuitBreaker(self):
+        """Test that an open circuit breaker rejects messages without posting them"""
+        self.server.status = 502
+        breaker = CircuitBreaker(failureThreshold=2, probeInterval=0.1)
+        sender = MattermostSender(self.server.url, circuitBreaker=breaker)
+        for _ in range(2):
+            with self.assertRaisesRegex(MattermostError, "502"):
+                sender.send("message")
+        with self.assertRaises(CircuitOpenError) as context:
+            sender.send("message")
+        self.assertGreater(context.exception.retryAfter, 0)
+        self.assertEqual(len(self.server.posts), 2)
+        time.sleep(0.1)
+        self.server.status = 200
+        sender.send("probe")
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(len(self.server.posts), 3)
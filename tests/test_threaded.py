@@ -6,8 +6,10 @@ Unit tests for MattermostSenderThreaded
 
 
 
+import time
 import unittest
-from mattermost_messenger import MattermostSenderThreaded
+from mattermost_messenger import MattermostSenderThreaded, RetryPolicy, CircuitBreaker
+from .webhookServer import WebhookServer
 
 
 webhookUrl = 'https://example.com/hooks/broken'
@@ -208,3 +210,219 @@ class TestMattermostSenderThreadedMoreArgs(unittest.TestCase):
         self.assertEqual(self.lastErrorData, 123)
 
 
+
+
+
+class TestMattermostSenderThreadedServer(unittest.TestCase):
+    """Tests for MattermostSenderThreaded with a local webhook server"""
+
+    def setUp(self):
+        """Start a local webhook server and a MattermostSenderThreaded object"""
+        self.errors = []
+        self.server = WebhookServer()
+        self.server.__enter__()
+        self.sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback)
+
+    def tearDown(self):
+        """Shut down MattermostSenderThreaded object and server"""
+        self.sender.shutdown()
+        self.server.__exit__(None, None, None)
+
+    def errorCallback(self, data, msg):
+        """Error callback collecting data and msg"""
+        self.errors.append((data, msg))
+
+    def testKeepAlive(self):
+        """Test that successive messages share one connection"""
+        self.sender.send("message 1")
+        self.sender._sendQueue.join()
+        self.sender.send("message 2")
+        self.sender.shutdown()
+        self.assertEqual(self.errors, [])
+        self.assertEqual([ p['text'] for p in self.server.posts ], ["message 1", "message 2"])
+        self.assertEqual(self.server.connections, 1)
+
+    def testPoolSize(self):
+        """Test poolSize argument"""
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback, poolSize=7)
+        self.assertEqual(sender.poolSize, 7)
+        sender.shutdown()
+
+    def testChannel(self):
+        """Test channel passed to send"""
+        self.sender.send("message 1", channel='other')
+        self.sender.send("message 2")
+        self.sender.shutdown()
+        self.assertEqual(self.server.posts, [{ 'text': "message 1", 'channel': 'other' },
+                                             { 'text': "message 2" }])
+
+    def queueItems(self, sender, items):
+        """Helper putting items into the queue of a shut down sender and sending them"""
+        sender.shutdown()
+        for item in items:
+            sender._sendQueue.put(item)
+        sender._sendAvailabelItems(sender._sendQueue.get())
+        self.assertTrue(sender._sendQueue.empty())
+
+    def testCoalesce(self):
+        """Test coalescing of queued items"""
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          coalesce=True, maxMessageLength=40)
+        Item = MattermostSenderThreaded._SendItem
+        self.queueItems(sender, [
+            Item(msg="message 1", emoji=':a:'),
+            Item(msg="message 2", emoji=':a:'),
+            Item(msg="message 3", emoji=':b:'),
+            Item(msg="message 4", emoji=':b:', channel='other'),
+            Item(msg="message 5", emoji=':b:', channel='other'),
+            Item(msg="message 6", emoji=':b:', channel='other'),
+        ])
+        self.assertEqual(self.errors, [])
+        self.assertEqual(self.server.posts, [
+            { 'text': ":a: message 1\n\n---\n\n:a: message 2", 'icon_emoji': ':a:' },
+            { 'text': "message 3", 'icon_emoji': ':b:' },
+            { 'text': ":b: message 4\n\n---\n\n:b: message 5", 'icon_emoji': ':b:', 'channel': 'other' },
+            { 'text': "message 6", 'icon_emoji': ':b:', 'channel': 'other' },
+        ])
+
+    def testCoalesceErrors(self):
+        """Test that errors of a combined post are reported per item"""
+        self.server.status = 500
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback, coalesce=True)
+        Item = MattermostSenderThreaded._SendItem
+        self.queueItems(sender, [ Item(msg="message 1", data=1), Item(msg="message 2", data=2) ])
+        self.assertEqual(len(self.server.posts), 1)
+        self.assertEqual([ data for data, _ in self.errors ], [1, 2])
+        self.assertRegex(self.errors[1][1], "sending message \"message 2\".+500")
+
+    def testWorkers(self):
+        """Test parallel workers keeping the order per channel"""
+        self.server.delay = 0.01
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          workers=4, poolSize=4)
+        self.assertEqual(sender.workers, 4)
+        self.assertEqual(sender._thread.name, 'Mattermost sender')
+        for i in range(40):
+            sender.send(f"{i}", channel=f"channel{i % 3}")
+        sender.shutdown()
+        self.assertFalse(any(thread.is_alive() for thread in sender._threads))
+        self.assertTrue(sender._sendQueue.empty())
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(self.server.posts), 40)
+        self.assertGreater(self.server.maxActive, 1)
+        for channel in range(3):
+            texts = [ int(p['text']) for p in self.server.posts if p['channel'] == f"channel{channel}" ]
+            self.assertEqual(texts, sorted(texts))
+
+    def testWorkersOrderingKey(self):
+        """Test workers with custom ordering key and coalescing"""
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          workers=3, coalesce=True, orderingKey=lambda item: item.data)
+        for i in range(30):
+            sender.send(f"{i}", data=i % 2)
+        sender.shutdown()
+        texts = "\n\n---\n\n".join(p['text'] for p in self.server.posts).split("\n\n---\n\n")
+        self.assertEqual(sorted(int(t) for t in texts), list(range(30)))
+        for key in range(2):
+            keyTexts = [ int(t) for t in texts if int(t) % 2 == key ]
+            self.assertEqual(keyTexts, sorted(keyTexts))
+        with self.assertRaises(ValueError):
+            MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback, workers=0)
+
+    def waitPosts(self, count):
+        """Wait until the server received :py:obj:`count` posts"""
+        deadline = time.monotonic() + 5
+        while len(self.server.posts) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def testRetry(self):
+        """Test that transient errors are retried without calling the error callback"""
+        self.server.replies = [ (502, {}), (503, {}) ]
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          retry=RetryPolicy(baseDelay=0.01, jitter=0))
+        sender.send("message", data=1)
+        sender._sendQueue.join()
+        self.assertEqual(self.errors, [])
+        self.assertEqual([ p['text'] for p in self.server.posts ], ["message"] * 3)
+        sender.shutdown()
+
+    def testRetryExhausted(self):
+        """Test that the error callback is called once after the last attempt"""
+        self.server.status = 502
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          retry=RetryPolicy(maxAttempts=2, baseDelay=0.01))
+        sender.send("message", data=1)
+        sender._sendQueue.join()
+        self.assertEqual(len(self.server.posts), 2)
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.errors[0][0], 1)
+        self.assertIn("502", self.errors[0][1])
+        sender.shutdown()
+
+    def testRetryNotRetryable(self):
+        """Test that permanent errors are not retried"""
+        self.server.status = 400
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          retry=RetryPolicy(baseDelay=0.01))
+        sender.send("message")
+        sender.shutdown()
+        self.assertEqual(len(self.server.posts), 1)
+        self.assertEqual(len(self.errors), 1)
+
+    def testRetryFreshMessages(self):
+        """Test that fresh messages don't wait for the backoff of a failed message"""
+        self.server.replies = [ (502, {}) ]
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          retry=RetryPolicy(baseDelay=0.3, jitter=0))
+        sender.send("message 1")
+        sender.send("message 2")
+        self.waitPosts(2)
+        self.assertEqual([ p['text'] for p in self.server.posts ], ["message 1", "message 2"])
+        sender._sendQueue.join()
+        self.assertEqual([ p['text'] for p in self.server.posts ], ["message 1", "message 2", "message 1"])
+        self.assertEqual(self.errors, [])
+        sender.shutdown()
+
+    def testRetryShutdown(self):
+        """Test that shutdown gives waiting retries a final attempt"""
+        self.server.replies = [ (502, {}) ]
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          retry=RetryPolicy(baseDelay=60))
+        sender.send("message")
+        self.waitPosts(1)
+        start = time.monotonic()
+        sender.shutdown()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([ p['text'] for p in self.server.posts ], ["message"] * 2)
+        self.assertEqual(self.errors, [])
+
+    def testCircuitBreakerFailFast(self):
+        """Test that messages fail fast while the circuit breaker is open"""
+        self.server.status = 502
+        breaker = CircuitBreaker(failureThreshold=2, probeInterval=60)
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          circuitBreaker=breaker)
+        for i in range(5):
+            sender.send(f"message {i}", data=i)
+        sender.shutdown()
+        self.assertEqual(len(self.server.posts), 2)
+        self.assertEqual([ data for data, _ in self.errors ], [0, 1, None, 2, 3, 4])
+        self.assertIn("changed from closed to open", self.errors[2][1])
+        self.assertIn("Circuit breaker is open", self.errors[3][1])
+        self.assertEqual(breaker._listeners, [])
+
+    def testCircuitBreakerParking(self):
+        """Test that messages are parked while the circuit breaker is open"""
+        self.server.replies = [ (502, {}) ]
+        breaker = CircuitBreaker(failureThreshold=1, probeInterval=0.2)
+        sender = MattermostSenderThreaded(self.server.url, errorCallback=self.errorCallback,
+                                          circuitBreaker=breaker,
+                                          retry=RetryPolicy(maxAttempts=2, baseDelay=0.01, jitter=0))
+        for i in range(4):
+            sender.send(f"message {i}", data=i)
+        sender._sendQueue.join()
+        texts = [ p['text'] for p in self.server.posts ]
+        self.assertEqual(texts, ["message 0", "message 0", "message 1", "message 2", "message 3"])
+        self.assertEqual([ msg.split("changed from ")[1] for _, msg in self.errors ],
+                         ["closed to open", "open to half-open", "half-open to closed"])
+        sender.shutdown()
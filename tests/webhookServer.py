@@ -0,0 +1,176 @@
+"""
+Copyright (C) DLR-TS 2024
+
+Local HTTP server imitating a Mattermost webhook for unit tests
+"""
+
+
+import json
+import socket
+import socketserver
+import threading
+import time
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+
+class WebhookServer:
+    """Minimal Mattermost webhook stand-in running in its own thread
+
+    Use it in a with statement. The server speaks HTTP/1.1 with keep-alive so
+    tests can check connection reuse. Every posted JSON body is stored in
+    :py:attr:`posts`, every accepted TCP connection is counted in
+    :py:attr:`connections`.
+    """
+
+    def __init__(self, status:int=HTTPStatus.OK, delay:float=0):
+        """
+        :param status: http status to reply with
+        :param delay:  seconds to wait before replying
+        """
+        self.status = status
+        self.delay = delay
+        self.posts:list[dict] = []
+        self.replies:list[tuple[int, dict[str, str]]] = []
+        """Replies (status, headers) used once each before falling back to :py:attr:`status`"""
+        self.connections = 0
+        self.maxActive = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._sockets:list = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+                    server._sockets.append(self.connection)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                with server._lock:
+                    server._active += 1
+                    server.maxActive = max(server.maxActive, server._active)
+                time.sleep(server.delay)
+                with server._lock:
+                    server._active -= 1
+                    server.posts.append(json.loads(body))
+                    status, headers = server.replies.pop(0) if server.replies else (server.status, {})
+                reply = b'ok'
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='WebhookServer')
+
+
+    @property
+    def url(self) -> str:
+        """URL of the fake webhook"""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/hooks/test'
+
+
+    def closeConnections(self) -> None:
+        """Close all open connections on server side like an idle timeout would do"""
+        with self._lock:
+            sockets, self._sockets = self._sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(2)
+            except OSError:
+                pass
+
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self.closeConnections()
+        self._thread.join()
+
+
+
+class TunnelProxy:
+    """Minimal http proxy supporting CONNECT tunnels, running in its own thread
+
+    Use it in a with statement. Every established tunnel is counted in
+    :py:attr:`tunnels`.
+    """
+
+    def __init__(self):
+        self.tunnels = 0
+        self._lock = threading.Lock()
+        proxy = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                requestLine = self.rfile.readline().decode('latin-1')
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                method, target, _ = requestLine.split(None, 2)
+                if method != 'CONNECT':
+                    self.wfile.write(b'HTTP/1.1 405 Method Not Allowed\r\n\r\n')
+                    return
+                host, port = target.rsplit(':', 1)
+                upstream = socket.create_connection((host, int(port)))
+                with proxy._lock:
+                    proxy.tunnels += 1
+                self.wfile.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+                self.wfile.flush()
+                relay = threading.Thread(target=self._relay, args=(upstream, self.connection), daemon=True)
+                relay.start()
+                self._relay(self.connection, upstream)
+                relay.join()
+
+            @staticmethod
+            def _relay(source, destination):
+                try:
+                    while data := source.recv(65536):
+                        destination.sendall(data)
+                except OSError:
+                    pass
+                finally:
+                    try:
+                        destination.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='TunnelProxy')
+
+
+    @property
+    def url(self) -> str:
+        """URL of the proxy"""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()